@@ -1,23 +1,21 @@
 import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
-import matplotlib.pyplot as plt
 import numpy as np
-from plotly.subplots import make_subplots
-import plotly.express as px
 from streamlit_option_menu import option_menu
 from ta.trend import SMAIndicator, EMAIndicator, MACD, PSARIndicator
 from ta.momentum import RSIIndicator
 from ta.volatility import BollingerBands
 from io import BytesIO
 import tempfile
+import time
 import plotly.io as pio
-from matplotlib.backends.backend_pdf import PdfPages
 from datetime import datetime
+from pricestore import load_price_volume, series_slice, META_COLUMNS
+from indicators import universe_snapshot
 
-from pdf import generate_pdf
-from drawchart import draw_chart
-from pdf_instance import get_pdf_instance
+# Các thư viện nặng (matplotlib, plotly.express, plotly.subplots, fpdf, Gemini và các module báo cáo)
+# chỉ được import trong hàm/tab cần dùng để giảm thời gian khởi động; đo bằng profile_startup.py
 
 
 st.set_page_config(layout="wide")  # Giao diện toàn màn hình
@@ -135,12 +133,12 @@ def load_and_process_data():
 
     return df1, merged_df, date_columns
 
-# Load data globally
-DF1, MERGED_DF, DATE_COLUMNS = load_and_process_data()
+# Dữ liệu vốn hóa được tải khi tab cần dùng (get_market_data), không tải khi import
 
 # Helper function to plot stock price
 def plot_stock_price(merged_df, stock_code):
     """Vẽ biểu đồ đường giá cổ phiếu theo mã cổ phiếu."""
+    import matplotlib.pyplot as plt
     stock_data = merged_df[merged_df['Code'] == stock_code]
     if stock_data.empty:
         st.warning(f"Không tìm thấy cổ phiếu có mã {stock_code}")
@@ -161,6 +159,7 @@ def plot_stock_price(merged_df, stock_code):
 
 # Plot sector treemap
 def plot_sector_treemap(selected_date):
+    import plotly.express as px
     sector_marketcap = MERGED_DF.groupby('Sector')[selected_date].sum().reset_index()
     fig = px.treemap(sector_marketcap, path=['Sector'], values=selected_date,
                         title=f'Vốn hóa thị trường theo ngành ({selected_date})',
@@ -169,6 +168,7 @@ def plot_sector_treemap(selected_date):
 
 # Plot bubble chart
 def plot_bubble_chart(selected_date):
+    import plotly.express as px
     bubble_data = MERGED_DF.groupby(['Sector', 'Code'])[selected_date].sum().reset_index()
     bubble_data = bubble_data[bubble_data[selected_date] > 0]
     if bubble_data.empty:
@@ -184,6 +184,7 @@ def plot_bubble_chart(selected_date):
 
 # Generate PDF report with stock price plot
 def generate_pdf_by_stock_code(stock_code):
+    from pdf_instance import get_pdf_instance
     progress_bar = st.progress(0)  # Initialize progress bar
     with st.spinner("📄 Đang tạo báo cáo PDF, vui lòng đợi..."):
         # Define SECTOR_MARKETCAP_T inside the function or globally
@@ -193,7 +194,6 @@ def generate_pdf_by_stock_code(stock_code):
         # Initialize PDF
         pdf = get_pdf_instance()
         pdf.add_page()
-        pdf.add_font("DejaVu", "", "DejaVuSans.ttf", uni=True)  # Regular
         pdf.set_font("DejaVu", size=12)
 
         pdf.cell(200, 10, "Báo cáo thị trường chứng khoán Việt Nam", ln=True, align='C')
@@ -265,29 +265,58 @@ def load_data_by_file(files):
     return data
 
 
-# 📌 Load dữ liệu từ file Excel
-@st.cache_data
+# 📌 Load dữ liệu giá & khối lượng từ kho dạng cột (Data/cache/price_volume.npz).
+# Kho được chuyển đổi từ Processed_Vietnam_Price.xlsx và Processed_Vietnam_volume_2.xlsx
+# một lần (hoặc khi file Excel thay đổi) và được giữ trong bộ nhớ của tiến trình.
 def load_data_tab3():
-    PRICE_DATA_PATH = r'./Data/Processed_Vietnam_Price.xlsx'
-    VOLUME_DATA_PATH = r'./Data/Processed_Vietnam_volume_2.xlsx'
+    # Kho gồm ma trận giá, khối lượng (mã × ngày), trục ngày và bảng thông tin mã (xem pricestore.load_price_volume).
+    # Không có cả file Excel lẫn kho đã chuyển đổi thì báo lỗi trên giao diện và trả về None.
+    try:
+        return load_price_volume()
+    except FileNotFoundError as e:
+        st.error(f"❌ {e}")
+        return None
 
-    file_price = "./Data/Thong_ke_gia_phan_loai_NDT/Processed_Vietnam_Price_Long.csv.gz"
-    file_volume = "./Data/Thong_ke_gia_phan_loai_NDT/Processed_Vietnam_Volume_Long.csv.gz"
 
-    # Phân tích kỹ thuật với MA
+def select_date(date_columns):
+    return st.selectbox("📅 Chọn ngày để hiển thị", date_columns)
 
-    # Load dữ liệu từ file Excel
-    df_price = pd.read_excel(PRICE_DATA_PATH)
-    df_volume = pd.read_excel(VOLUME_DATA_PATH)
 
-    # Chọn đúng cột ngày từ H -> BHN (cột ngày)
-    date_columns = df_price.columns[7:]  # Cột H là cột thứ 7 (0-based index)
+# Tên hiển thị (mã -> tên công ty) lấy từ chính bộ dữ liệu của tab
+def dataset_names(df, code_column="Code", name_column="Name"):
+    if code_column not in df.columns or name_column not in df.columns:
+        return {}
+    names = df[[code_column, name_column]].dropna().drop_duplicates(code_column)
+    return dict(zip(names[code_column], names[name_column]))
 
-    return df_price, df_volume, date_columns
 
+def select_stock_code(label, stock_codes, names=None):
+    """
+    Chọn mã cổ phiếu, kèm ô tìm kiếm theo mã hoặc tên công ty (không cần gõ dấu).
+    names: tên hiển thị lấy từ dữ liệu của tab, cũng là nguồn tên để tìm kiếm; không đọc dữ liệu tài chính.
+    """
+    from datastore import get_name_index, loaded_fundamentals
+    from search_index import search_companies, build_name_index_from_names
+    display = dict(names or {})
+    # Tab đã đọc dữ liệu tài chính thì dùng thêm tên công ty trong đó (hiển thị và tìm kiếm)
+    fundamentals = loaded_fundamentals()
+    fundamentals_index = get_name_index(fundamentals) if fundamentals is not None else None
+    if fundamentals_index is not None:
+        display.update(fundamentals_index["display"])
+    options = list(stock_codes)
+
+    query = st.text_input("🔎 Tìm theo mã hoặc tên công ty (ví dụ: HOA PHAT)")
+    if query:
+        name_index = build_name_index_from_names(names or {}, fundamentals_index)
+        available = set(options)
+        matches = [code for code in search_companies(name_index, query, limit=50) if code in available]
+        if matches:
+            options = matches
+        else:
+            st.warning(f"⚠ Không tìm thấy công ty phù hợp với '{query}'")
 
-def select_date(date_columns):
-    return st.selectbox("📅 Chọn ngày để hiển thị", date_columns)
+    return st.selectbox(label, options=options,
+                        format_func=lambda code: f"{code} - {display[code]}" if code in display else code)
 
 
 def select_time_period():
@@ -319,6 +348,8 @@ def load_data2(price_file, volume_file):
 
 # PDF Export Functionality using Matplotlib
 def export_pdf_combined(fig_plot, date, exportImage = False):
+	import matplotlib.pyplot as plt
+	from matplotlib.backends.backend_pdf import PdfPages
 	try:
 		buf = BytesIO()
 
@@ -367,7 +398,7 @@ def create_summary_table(df_price, df_volume, selected_date):
 
     # Lấy ngày trước đó để tính % Change
     prev_day_index = df_price.columns.get_loc(selected_date) - 1
-    if prev_day_index < 7:  # Đảm bảo không lấy cột không hợp lệ
+    if prev_day_index < len(META_COLUMNS):  # Đảm bảo không lấy cột thông tin mã
         st.warning("⚠ Không đủ dữ liệu để tính toán % thay đổi.")
         return None
 
@@ -401,6 +432,7 @@ def plot_price_trend(df_price, tickers, selected_date, start_date, date_columns)
     """
     Vẽ biểu đồ xu hướng giá đóng cửa theo thời gian.
     """
+    import plotly.express as px
     # ✅ Chuyển đổi `date_columns` thành `datetime`
     date_columns_dt = pd.to_datetime(date_columns, format="%Y-%m-%d", errors="coerce").dropna().sort_values()
 
@@ -447,100 +479,42 @@ def plot_price_trend(df_price, tickers, selected_date, start_date, date_columns)
     st.plotly_chart(fig, use_container_width=True)
 
 
-def calculate_indicators_snapshot(df_price, df_volume, selected_date):
+def calculate_indicators_snapshot(price_store, selected_date):
     """
-    Tính toán các chỉ báo (theo snapshot) cho cổ phiếu dựa trên dữ liệu giá và khối lượng.
+    Tính toán các chỉ báo (theo snapshot) cho toàn bộ cổ phiếu tại ngày đã chọn.
+    Mỗi chỉ báo được tính dọc theo lịch sử giá của từng mã (indicators.universe_snapshot).
     Hàm này dùng để hiển thị bảng chỉ báo.
     """
-    if selected_date not in df_price.columns or selected_date not in df_volume.columns:
+    if selected_date not in price_store["dates"]:
         st.warning(f"⚠ Ngày {selected_date} không tồn tại trong dữ liệu!")
         return None
+    return universe_snapshot(price_store, selected_date)
 
-    prev_day_index = df_price.columns.get_loc(selected_date) - 1
-    if prev_day_index < 7:
-        st.warning("⚠ Không đủ dữ liệu để tính toán chỉ báo.")
-        return None
-    prev_day = df_price.columns[prev_day_index]
-
-    df = pd.DataFrame()
-    df['Code'] = df_price['Code']
-    df['open'] = pd.to_numeric(df_price[prev_day], errors='coerce')
-    df['close'] = pd.to_numeric(df_price[selected_date], errors='coerce')
-    df['high'] = df_price.loc[:, prev_day:selected_date].max(axis=1)
-    df['low'] = df_price.loc[:, prev_day:selected_date].min(axis=1)
-    df['volume'] = pd.to_numeric(df_volume[selected_date], errors='coerce')
-    df = df.dropna()
 
-    # Tính toán MA
-    for period in [20, 50, 100, 200]:
-        df[f'sma_{period}'] = SMAIndicator(close=df['close'], window=period).sma_indicator()
-        df[f'ema_{period}'] = EMAIndicator(close=df['close'], window=period).ema_indicator()
-    # MACD
-    macd = MACD(close=df['close'], window_slow=26, window_fast=12, window_sign=9)
-    df['macd_line'] = macd.macd()
-    df['macd_signal'] = macd.macd_signal()
-    df['macd_histogram'] = macd.macd_diff()
-    # PSAR
-    psar = PSARIndicator(high=df['high'], low=df['low'], close=df['close'])
-    df['psar'] = psar.psar()
-    # RSI
-    for period in [9, 14, 21]:
-        df[f'rsi_{period}'] = RSIIndicator(close=df['close'], window=period).rsi()
-    # CCI
-    for period in [10, 20, 30]:
-        df[f'cci_{period}'] = (df['close'] - df['close'].rolling(period).mean()) / (
-                0.015 * df['close'].rolling(period).std())
-    # Bollinger Bands
-    bollinger = BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['bb_middle'] = bollinger.bollinger_mavg()
-    df['bb_upper'] = bollinger.bollinger_hband()
-    df['bb_lower'] = bollinger.bollinger_lband()
-    # OBV
-    df['obv'] = (np.sign(df['close'].diff()) * df['volume']).fillna(0).cumsum()
-    # MFI
-    df['typical_price'] = (df['high'] + df['low'] + df['close']) / 3
-    df['raw_money_flow'] = df['typical_price'] * df['volume']
-    df['money_flow_ratio'] = df['raw_money_flow'].rolling(14).sum() / df['raw_money_flow'].rolling(14).sum().shift(
-        1)
-    df['mfi'] = 100 - (100 / (1 + df['money_flow_ratio']))
-    return df
-
-
-def get_stock_timeseries(stock, df_price, df_volume, date_columns_dt, start_date, end_date):
+def get_stock_timeseries(stock, price_store, start_date, end_date):
     """
     Trích xuất chuỗi thời gian cho mã cổ phiếu đã chọn.
-    Chỉ lấy các ngày trong khoảng [start_date, end_date].
-    Giả sử các cột của df_price, df_volume có tên là chuỗi 'YYYY-MM-DD'.
+    Chỉ lấy các ngày trong khoảng [start_date, end_date]: một lát cắt trên dòng của mã trong ma trận giá/khối lượng.
     """
-    # Lọc các ngày hợp lệ
-    valid_dates = [d for d in date_columns_dt if start_date <= d <= end_date]
-
-    stock_row = df_price[df_price['Code'] == stock]
-    volume_row = df_volume[df_volume['Code'] == stock]
-    if stock_row.empty or volume_row.empty:
+    series = series_slice(price_store, stock, start_date, end_date)
+    if series is None:
         st.error("⚠ Không tìm thấy dữ liệu cho mã cổ phiếu này!")
         return None
-
-    prices = []
-    volumes = []
-    for date_str in valid_dates:
-        price_val = pd.to_numeric(stock_row[date_str].values[0], errors='coerce')
-        volume_val = pd.to_numeric(volume_row[date_str].values[0], errors='coerce')
-        prices.append(price_val)
-        volumes.append(volume_val)
-    df_ts = pd.DataFrame({
-        'Date': valid_dates,
-        'close': prices,
-        'volume': volumes
-    })
+    dates, close, volume = series
+    close = close.astype(float)
 
     # Xác định giá mở: lấy giá đóng của ngày trước đó (với ngày đầu tiên thì open = close)
-    df_ts['open'] = df_ts['close'].shift(1)
-    df_ts.loc[df_ts['open'].isna(), 'open'] = df_ts['close']
+    open_price = np.concatenate([close[:1], close[:-1]])
+    open_price = np.where(np.isnan(open_price), close, open_price)
     # Giả định high = max(open, close), low = min(open, close)
-    df_ts['high'] = df_ts[['open', 'close']].max(axis=1)
-    df_ts['low'] = df_ts[['open', 'close']].min(axis=1)
-    return df_ts
+    return pd.DataFrame({
+        'Date': dates,
+        'close': close,
+        'volume': volume.astype(float),
+        'open': open_price,
+        'high': np.fmax(open_price, close),
+        'low': np.fmin(open_price, close),
+    })
 
 
 def compute_timeseries_indicators(df):
@@ -595,6 +569,7 @@ def update_chart(df, company, selected_indicators, selected_ma, selected_rsi, se
     Xây dựng biểu đồ Plotly dựa trên dữ liệu chuỗi thời gian (df) và các lựa chọn của người dùng.
     Phiên bản này được chuyển thể từ code Dash (update_graph).
     """
+    from plotly.subplots import make_subplots
     # Nếu không chọn chỉ báo hay tổ hợp nào, chỉ hiển thị biểu đồ nến
     # Tạo figure
     fig = go.Figure(
@@ -2008,24 +1983,6 @@ def count_increasing_ma(df_long, ma_periods):
         df_ma_increase[f"Increase_MA{ma}"] = df_ma_increase[f"MA{ma}"].diff() > 0
     return df_ma_increase.groupby("Date")[[f"Increase_MA{ma}" for ma in ma_periods]].sum()
 
-    buf = BytesIO()
-    with PdfPages(buf) as pdf:
-        plt.figure(figsize=(8, 6))
-        plt.text(0.5, 0.8, "Foreign Investor Trading Report", fontsize=14, ha='center')
-        plt.text(0.5, 0.6, f"Date Extracted: {date.strftime('%d/%m/%Y')}", fontsize=12, ha='center')
-        plt.axis("off")
-        pdf.savefig()
-        plt.close()
-
-        fig_bytes = pio.to_image(fig_plot, format="png")
-        img = plt.imread(BytesIO(fig_bytes))
-        plt.figure(figsize=(10, 6))
-        plt.imshow(img)
-        plt.axis("off")
-        pdf.savefig()
-        plt.close()
-    buf.seek(0)
-    return buf
 
 def createFigureTab2(filtered_data, ticker_selected, renderFig = True):
     # Lọc bỏ ngày không có dữ liệu và sắp xếp lại dữ liệu để không có khoảng trống trên biểu đồ
@@ -2110,19 +2067,46 @@ file_paths = {
     "./Data/CleanedFT/FT2325_cleaned.csv"
 }
 
-# Tải dữ liệu
-dataframesTab2 = load_data_by_file(file_paths)
-
-# 📌 Gọi hàm vẽ biểu đồ
-df_price_tab3, df_volume_tab3, date_columns_tab3 = load_data_tab3()
+# Thời gian tải lần đầu (khi bộ nhớ đệm còn trống) của mỗi bộ dữ liệu, dùng chung cho mọi phiên và mọi lần chạy lại
+@st.cache_resource
+def _cold_load_timings():
+    return {}
+
+# Tải dữ liệu khi tab cần dùng và ghi thời gian tải lần đầu (giây) vào session_state["load_timings"].
+# Các lần chạy lại lấy dữ liệu từ bộ nhớ đệm nên không ghi đè thời gian tải lần đầu.
+def _timed_load(name, loader, *args):
+    start = time.perf_counter()
+    result = loader(*args)
+    elapsed = time.perf_counter() - start
+    timings = _cold_load_timings()
+    if name not in timings:
+        timings[name] = elapsed
+        print(f"✅ Đã tải {name} trong {elapsed:.2f} giây")
+    st.session_state.setdefault("load_timings", {})[name] = timings[name]
+    return result
+
+# Dữ liệu vốn hóa thị trường: tab 0, 1, 4
+def get_market_data():
+    return _timed_load("Vốn hóa thị trường", load_and_process_data)
+
+# Dữ liệu giao dịch theo ngành: tab 0, 2
+def get_sector_data():
+    return _timed_load("Giao dịch theo ngành", load_data_by_file, file_paths)
+
+# Kho giá và khối lượng: tab 0, 3
+def get_price_volume_data():
+    return _timed_load("Giá & khối lượng", load_data_tab3)
 
 # Create a comprehensive PDF report
 def generate_comprehensive_pdf(stock_code, selected_date, start_date, end_date, selected_indicators, df_ts, selected_ma, selected_rsi, selected_cci, selected_combination):
+	from pdf import generate_pdf
+	from drawchart import draw_chart
+	from report import build_report_context
+	from pdf_instance import get_pdf_instance
 	progress_bar = st.progress(0)  # Initialize progress bar
 
 	file_name = f"Báo cáo Phân tích tổng hợp {stock_code}.pdf"
 	pdf = get_pdf_instance()
-	pdf.add_font("DejaVu", "", "DejaVuSans.ttf", uni=True)
 	pdf.set_font("DejaVu", size=12)
 
 	# Title Page
@@ -2228,9 +2212,9 @@ def generate_comprehensive_pdf(stock_code, selected_date, start_date, end_date,
 	pdf.set_font("DejaVu", size=16)
 	pdf.cell(200, 20, "3. Phân tích Kỹ thuật", ln=True)
 
-	if df_price_tab3 is not None or df_volume_tab3 is not None:
+	if price_store is not None:
 		# Hiển thị bảng snapshot chỉ báo
-		df_snapshot_tab3 = calculate_indicators_snapshot(df_price_tab3, df_volume_tab3, selected_date)
+		df_snapshot_tab3 = calculate_indicators_snapshot(price_store, selected_date)
 		if df_snapshot_tab3 is not None:
 			# Xây dựng biểu đồ dựa trên các lựa chọn
 			fig = update_chart(df_ts, stock_code, selected_indicators, selected_ma, selected_rsi, selected_cci,
@@ -2253,10 +2237,12 @@ def generate_comprehensive_pdf(stock_code, selected_date, start_date, end_date,
 	pdf.add_page()
 	pdf.cell(200, 20, "4. Báo cáo Tài chính", ln=True)
 	
-	draw_chart(stock_code)
+	report_context = build_report_context(stock_code)
+	if report_context is not None:
+		report_context["charts"] = draw_chart(stock_code, context=report_context)
 	progress_bar.progress(3.5 / 4)  # Update progress
 
-	generate_pdf(stock_code, pdf)
+	generate_pdf(stock_code, pdf, report_context)
 	progress_bar.progress(4 / 4)  # Update progress
      
 	pdf.output(file_name, "F")
@@ -2271,6 +2257,7 @@ def generate_comprehensive_pdf(stock_code, selected_date, start_date, end_date,
 
 # ============================================ MAIN ========================================================
 if selected == "1. Tổng quan thị trường":
+    DF1, MERGED_DF, DATE_COLUMNS = get_market_data()
     st.markdown("<h1>📊 Tổng quan thị trường</h1>", unsafe_allow_html=True)
     st.markdown("<h6>Tổng quan về vốn hóa TTCK Việt Nam</h6>", unsafe_allow_html=True)
 
@@ -2280,7 +2267,8 @@ if selected == "1. Tổng quan thị trường":
 
     # Get the stock code input from the user
     stock_codes = MERGED_DF["Code"].dropna().unique()
-    stock_code = st.selectbox("Chọn mã cổ phiếu để xem giá trị thị trường", options=stock_codes)
+    stock_code = select_stock_code("Chọn mã cổ phiếu để xem giá trị thị trường", stock_codes,
+                                   dataset_names(MERGED_DF))
     if stock_code:
         fig_stock = plot_stock_price(MERGED_DF, stock_code)
         if fig_stock:
@@ -2296,6 +2284,7 @@ elif selected == "2. Tổng quan theo ngành":
     st.markdown("<h1>📊 Tổng quan theo ngành</h1>", unsafe_allow_html=True)
     st.markdown("<h6>Dòng tiền và giá đóng cửa</h6>", unsafe_allow_html=True)
 
+    dataframesTab2 = get_sector_data()
     data = dataframesTab2.copy()
 
     # Kiểm tra nếu dữ liệu rỗng
@@ -2304,7 +2293,7 @@ elif selected == "2. Tổng quan theo ngành":
     else:
         # Chọn mã cổ phiếu
         tickers = sorted(data["Ticker"].dropna().unique())
-        ticker_selected = st.selectbox("Chọn mã cổ phiếu", tickers)
+        ticker_selected = select_stock_code("Chọn mã cổ phiếu", tickers, dataset_names(data, "Ticker"))
 
         # Chọn khoảng thời gian
         min_date = data["Date"].min()
@@ -2336,26 +2325,27 @@ elif selected == "2. Tổng quan theo ngành":
                 )
 
 elif selected == "3. Phân tích kỹ thuật":
+    price_store = get_price_volume_data()
     st.markdown("<h1>📊Phân tích kỹ thuật</h1>", unsafe_allow_html=True)
  
     # if subpage == "Chi tiết cổ phiếu":
     st.title("📈 Phân tích Chi Tiết Mã Cổ Phiếu")
-    if df_price_tab3 is None or df_volume_tab3 is None:
+    if price_store is None:
         st.stop()
 
-    # Chuyển đổi date_columns_tab3 sang datetime
-    date_columns_dt_tab3 = pd.to_datetime(date_columns_tab3, format="%Y-%m-%d", errors="coerce").dropna().sort_values()
+    # Trục ngày giao dịch (đã sắp xếp tăng dần)
+    date_columns_dt_tab3 = price_store["dates"]
     # Lấy ngày kết thúc
     selected_date = select_date(date_columns_dt_tab3)
     # Hiển thị bảng snapshot chỉ báo
-    df_snapshot_tab3 = calculate_indicators_snapshot(df_price_tab3, df_volume_tab3, selected_date)
+    df_snapshot_tab3 = calculate_indicators_snapshot(price_store, selected_date)
     if df_snapshot_tab3 is not None:
         st.write("🔍 **Bảng chỉ báo kỹ thuật (snapshot)**")
         st.dataframe(df_snapshot_tab3)
         # Dropdown chọn mã cổ phiếu
         stock_list = df_snapshot_tab3['Code'].unique().tolist()
 
-        selected_stock_tab3 = st.selectbox("Chọn mã cổ phiếu", stock_list)
+        selected_stock_tab3 = select_stock_code("Chọn mã cổ phiếu", stock_list, dataset_names(price_store["meta"]))
         if not selected_stock_tab3:
             st.warning("⚠ Vui lòng chọn ít nhất một mã cổ phiếu!")
             st.stop()
@@ -2403,9 +2393,8 @@ elif selected == "3. Phân tích kỹ thuật":
             st.warning(f"⚠ Không có đủ dữ liệu để tính {time_range_tab3}! Đang chọn ngày sớm nhất có thể.")
             start_date = date_columns_dt_tab3.min()
 
-        # Lấy chuỗi thời gian cho mã được chọn (sử dụng dữ liệu từ file Excel)
-        df_ts = get_stock_timeseries(selected_stock_tab3, df_price_tab3, df_volume_tab3, date_columns_dt_tab3, start_date,
-                                        selected_date)
+        # Lấy chuỗi thời gian cho mã được chọn (lát cắt trên ma trận giá & khối lượng)
+        df_ts = get_stock_timeseries(selected_stock_tab3, price_store, start_date, selected_date)
         
         if df_ts is None or df_ts.empty:
             st.error("⚠ Không đủ dữ liệu thời gian cho mã được chọn.")
@@ -2432,21 +2421,50 @@ elif selected == "3. Phân tích kỹ thuật":
         )
 
 elif selected == "4. Báo cáo tài chính":
+    from pdf import generate_pdf
+    from drawchart import draw_chart
+    from report import build_report_context
+    from scoring import get_scores
+    DF1, MERGED_DF, DATE_COLUMNS = get_market_data()
     st.title("📝 Báo cáo tài chính")
 
     stock_codes = MERGED_DF["Code"].dropna().unique()
-    stock_code = st.selectbox("Chọn mã cổ phiếu", options=stock_codes)
+    stock_code = select_stock_code("Chọn mã cổ phiếu", stock_codes, dataset_names(MERGED_DF))
 
     # Nút xuất báo cáo PDF
     if st.button("📄 Xuất báo cáo PDF"):
         with st.spinner("⏳ Đang tạo biểu đồ..."):
-            draw_chart(stock_code)
+            report_context = build_report_context(stock_code)
+            if report_context is not None:
+                report_context["charts"] = draw_chart(stock_code, context=report_context)
         with st.spinner("⏳ Đang tạo báo cáo PDF..."):
-            generate_pdf(stock_code)
+            # Nhận xét AI được hiển thị dần trong lúc model trả về, PDF hoàn tất khi nhận đủ
+            st.subheader("🤖 Nhận xét tài chính từ AI")
+            commentary_placeholder = st.empty()
+            generate_pdf(stock_code, context=report_context,
+                         on_commentary=lambda text: commentary_placeholder.markdown(text))
         st.success(f"✅ Báo cáo PDF cho {stock_code} đã được tạo thành công!")
+
+    # Bảng chấm điểm chất lượng cho toàn thị trường (tính sẵn, lọc và sắp xếp trực tiếp)
+    st.subheader("🏅 Chấm điểm Piotroski F-score & Altman Z-score")
+    scores = get_scores()
+    score_years = sorted(scores.index.get_level_values(1).unique(), reverse=True)
+    score_year = st.selectbox("Chọn năm chấm điểm", score_years)
+    min_f_score = st.slider("F-Score tối thiểu", min_value=0, max_value=9, value=0)
+    altman_zones = ["An toàn", "Cảnh báo", "Nguy hiểm"]
+    selected_zones = st.multiselect("Vùng Altman Z''", altman_zones, default=altman_zones)
+
+    score_table = scores.xs(score_year, level=1)
+    score_table = score_table[(score_table["F-Score"] >= min_f_score) & score_table["Vùng Altman"].isin(selected_zones)]
+    st.dataframe(score_table.sort_values(["F-Score", "Altman Z"], ascending=False))
         
 elif selected == "0. PHÂN TÍCH TỔNG HỢP":
+    DF1, MERGED_DF, DATE_COLUMNS = get_market_data()
+    dataframesTab2 = get_sector_data()
+    price_store = get_price_volume_data()
     st.title("🔍 Phân tích Tổng Hợp - Cung cấp góc nhìn 360 độ thể thao")
+    if price_store is None:
+        st.stop()
     
     # Create columns for better layout
     col1, col2 = st.columns([2, 1])
@@ -2454,7 +2472,7 @@ elif selected == "0. PHÂN TÍCH TỔNG HỢP":
     with col1:
         # Get the stock code input from the user
         stock_codes = MERGED_DF["Code"].dropna().unique()
-        stock_code = st.selectbox("Chọn mã cổ phiếu", options=stock_codes)
+        stock_code = select_stock_code("Chọn mã cổ phiếu", stock_codes, dataset_names(MERGED_DF))
         
         # Technical Analysis Filters
         st.subheader("1. Bộ lọc - Tổng quan thị trường")
@@ -2481,8 +2499,8 @@ elif selected == "0. PHÂN TÍCH TỔNG HỢP":
         st.subheader("3. Bộ lọc - Phân tích kỹ thuật")
         st.markdown("<div style='text-align: center'>(Đầu vào bao gồm: Mã cổ phiếu + chỉ báo kĩ thuật + khoảng thời gian)</div>", unsafe_allow_html=True)
         
-        # Chuyển đổi date_columns_tab3 sang datetime
-        date_columns_dt_tab3 = pd.to_datetime(date_columns_tab3, format="%Y-%m-%d", errors="coerce").dropna().sort_values()
+        # Trục ngày giao dịch (đã sắp xếp tăng dần)
+        date_columns_dt_tab3 = price_store["dates"]
         # Lấy ngày kết thúc
         selected_date = select_date(date_columns_dt_tab3)
 
@@ -2534,9 +2552,8 @@ elif selected == "0. PHÂN TÍCH TỔNG HỢP":
         #     st.warning(f"⚠ Không có đủ dữ liệu để tính {time_range_tab3}! Đang chọn ngày sớm nhất có thể.")
         #     start_date = date_columns_dt_tab3.min()
 
-        # Lấy chuỗi thời gian cho mã được chọn (sử dụng dữ liệu từ file Excel)
-        df_ts = get_stock_timeseries(stock_code, df_price_tab3, df_volume_tab3, date_columns_dt_tab3, start_date,
-                                        selected_date)
+        # Lấy chuỗi thời gian cho mã được chọn (lát cắt trên ma trận giá & khối lượng)
+        df_ts = get_stock_timeseries(stock_code, price_store, start_date, selected_date)
         
         if df_ts is None or df_ts.empty:
             st.error("⚠ Không đủ dữ liệu thời gian cho mã được chọn.")
@@ -2562,4 +2579,10 @@ elif selected == "0. PHÂN TÍCH TỔNG HỢP":
                 # Generate and save the PDF
                 generate_comprehensive_pdf(stock_code, selected_date, start_date, end_date, selected_indicators, df_ts, selected_ma, selected_rsi, selected_cci, selected_combination)
                 st.success("✅ Báo cáo tổng hợp đã được tạo thành công!")
-# ============================== TỔNG HỢP - END ===============================
\ No newline at end of file
+# ============================== TỔNG HỢP - END ===============================
+
+# Thời gian tải lần đầu của dữ liệu các tab đã mở trong phiên
+if st.session_state.get("load_timings"):
+    with st.sidebar.expander("⏱️ Thời gian tải dữ liệu"):
+        for name, elapsed in st.session_state["load_timings"].items():
+            st.caption(f"{name}: {elapsed:.2f} giây")
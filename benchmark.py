@@ -0,0 +1,88 @@
+import os
+import pandas as pd
+from datastore import get_fundamentals
+from readdata import process_financial_data_many
+from caculate import calculate_financial_ratios_many
+
+# File phân loại ngành ICB của các doanh nghiệp niêm yết
+CLASSIFICATION_PATH = os.path.join("Data", "Phan_loai_nganh.xlsx")
+INDUSTRY_LEVEL = "Ngành ICB - cấp 2"
+
+# Bảng chuẩn ngành đã tính, dựng lại khi dữ liệu tài chính hoặc file phân loại thay đổi
+_benchmarks = {}
+
+
+# Đọc bảng phân loại ngành: mã cổ phiếu -> ngành ICB các cấp
+def load_industry_classification(path=CLASSIFICATION_PATH):
+    df = pd.read_excel(path, header=8, engine="openpyxl")
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.dropna(subset=["Mã"])
+    df["Mã"] = df["Mã"].astype(str).str.strip().str.upper()
+    return df.drop_duplicates("Mã").set_index("Mã")
+
+
+# Tính bảng chuẩn ngành: trung vị, tứ phân vị và thứ hạng phần trăm của từng công ty
+def compute_industry_benchmarks(ratios, classification, level=INDUSTRY_LEVEL):
+    """
+    ratios: kết quả của calculate_financial_ratios_many, chỉ mục (MÃ, NĂM).
+    Trả về dict gồm:
+      - "summary": chỉ mục (ngành, NĂM), cột (chỉ số, thống kê) với median, q1, q3, count
+      - "ranks": chỉ mục (MÃ, NĂM), thứ hạng phần trăm (0-100) của từng chỉ số trong ngành
+    """
+    tickers = ratios.index.get_level_values(0)
+    industry = classification[level].reindex(tickers).to_numpy()
+
+    # Năm không có số liệu (tổng tài sản bằng 0) không được tính vào thống kê ngành
+    values = ratios.where(ratios["Total Assets"] != 0)
+    values = values[pd.notna(industry)]
+    industry = pd.Series(industry[pd.notna(industry)], index=values.index, name=level)
+    groups = values.groupby([industry, values.index.get_level_values(1)])
+
+    summary = pd.concat({
+        "median": groups.median(),
+        "q1": groups.quantile(0.25),
+        "q3": groups.quantile(0.75),
+        "count": groups.count(),
+    }, axis=1).swaplevel(axis=1).sort_index(axis=1)
+
+    ranks = groups.rank(pct=True) * 100
+    ranks.insert(0, level, industry)
+    return {"level": level, "summary": summary, "ranks": ranks}
+
+
+# Lấy bảng chuẩn ngành, chỉ tính lại khi phiên bản dữ liệu thay đổi
+def get_industry_benchmarks(level=INDUSTRY_LEVEL, path=CLASSIFICATION_PATH):
+    stat = os.stat(path)
+    version = (get_fundamentals()["signature"], stat.st_mtime, stat.st_size, level)
+    cached = _benchmarks.get("current")
+    if cached is None or cached["version"] != version:
+        ratios = calculate_financial_ratios_many(process_financial_data_many())
+        cached = compute_industry_benchmarks(ratios, load_industry_classification(path), level)
+        cached["ratios"] = ratios
+        cached["version"] = version
+        _benchmarks["current"] = cached
+    return cached
+
+
+# Vị thế của một mã so với các doanh nghiệp cùng ngành trong một năm (mặc định năm gần nhất)
+def get_peer_standing(ticker, year=None, benchmarks=None):
+    benchmarks = get_industry_benchmarks() if benchmarks is None else benchmarks
+    ticker = str(ticker).strip().upper()
+    if year is None:
+        year = benchmarks["ratios"].index.get_level_values(1).max()
+
+    key = (ticker, int(year))
+    if key not in benchmarks["ranks"].index:
+        return pd.DataFrame()
+
+    rank = benchmarks["ranks"].loc[key]
+    industry = rank[benchmarks["level"]]
+    summary = benchmarks["summary"].loc[(industry, int(year))]
+    value = benchmarks["ratios"].loc[key]
+
+    standing = summary.unstack()[["q1", "median", "q3", "count"]]
+    standing.insert(0, "value", value.reindex(standing.index))
+    standing["percentile"] = rank.drop(benchmarks["level"]).reindex(standing.index)
+    standing.attrs["industry"] = industry
+    standing.attrs["year"] = int(year)
+    return standing.reindex(value.index)
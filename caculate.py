@@ -1,10 +1,7 @@
 import numpy as np
 import pandas as pd
-
-# Hàm lấy giá trị từ transposed_df
-def get_values(transposed_df, label):
-    row = transposed_df[transposed_df["Chỉ tiêu"] == label]
-    return row.iloc[:, 1:].values.flatten() if not row.empty else np.zeros(len(transposed_df.columns[1:]))
+from functools import lru_cache
+from formula import compile_formulas, evaluate_formulas
 
 # Các chỉ tiêu cần thiết
 labels = {
@@ -42,81 +39,120 @@ labels = {
     "operating_profit": ["KQKD. LỢI NHUẬN THUẦN TỪ HOẠT ĐỘNG KINH DOANH"],
     "other_profit": ["KQKD. LỢI NHUẬN KHÁC"],
     "jv_profit": ["KQKD. LÃI/ LỖ TỪ CÔNG TY LIÊN DOANH (TRƯỚC 2015)"],
-    "other_income": ["KQKD. LỢI NHUẬN KHÁC"]
+    "other_income": ["KQKD. LỢI NHUẬN KHÁC"],
+
+    # Các chỉ tiêu dùng cho chấm điểm Piotroski F-score và Altman Z-score (scoring.py)
+    "current_assets": ["CĐKT. TÀI SẢN NGẮN HẠN"],
+    "retained_earnings": ["CĐKT. LÃI CHƯA PHÂN PHỐI"],
+    "long_term_borrowings": ["CĐKT. VAY VÀ NỢ THUÊ TÀI CHÍNH DÀI HẠN"],
+    "profit_before_tax": ["KQKD. TỔNG LỢI NHUẬN KẾ TOÁN TRƯỚC THUẾ"],
+    "borrowing_cost": ["KQKD. TRONG ĐÓ: CHI PHÍ LÃI VAY"],  # Ghi nhận là số âm
+    "operating_cash_flow": ["LCTT. LƯU CHUYỂN TIỀN TỆ RÒNG TỪ CÁC HOẠT ĐỘNG SẢN XUẤT KINH DOANH (TT)"],
+    "equity_issued": ["LCTT. TIỀN THU TỪ PHÁT HÀNH CỔ PHIẾU, NHẬN GÓP VỐN CỦA CHỦ SỞ HỮU (TT)"]
 }
 
+# Các chỉ số hiển thị theo phần trăm (nhân 100)
+PERCENT_RATIOS = {"ROE", "ROA", "ROS", "Revenue/Total Assets", "Long Term Debt/Equity", "Total Debt/Equity"}
+
+# Công thức các chỉ số: tên ở vế phải là khóa trong labels hoặc một công thức khác
+formulas = [
+    "ebitda = net_income + interest_expense + taxes + depreciation_amortization",
+    "net_income_before_taxes = operating_profit + other_profit + jv_profit",
+    "net_income_before_extraordinary_items = net_income + other_income",
+    "total_operating_expense = revenue - gross_profit + financial_expense + selling_expense + admin_expense",
+    "roe = net_income / total_equity",
+    "roa = net_income / total_assets",
+    "ros = net_income / revenue",
+    "income_after_tax_margin = net_income / revenue",
+    "revenue_to_total_assets = revenue / total_assets",
+    "long_term_debt_to_equity = total_long_term_debt / total_equity",
+    "total_debt_to_equity = total_debt / total_equity",
+]
+
+# Tên cột kết quả -> tên biến trong công thức (theo đúng thứ tự hiển thị)
+ratio_columns = {
+    "Total Current Assets": "total_current_assets",
+    "Property/Plant/Equipment": "ppe",
+    "Total Assets": "total_assets",
+    "Total Current Liabilities": "total_current_liabilities",
+    "Total Long-Term Debt": "total_long_term_debt",
+    "Total Liabilities": "total_liabilities",
+    "EBITDA": "ebitda",
+    "Net Income Before Taxes": "net_income_before_taxes",
+    "Net Income Before Extraordinary Items": "net_income_before_extraordinary_items",
+    "Revenue": "revenue",
+    "Total Operating Expense": "total_operating_expense",
+    "Net Income After Taxes": "net_income",
+    "ROE": "roe",
+    "ROA": "roa",
+    "ROS": "ros",
+    "Income After Tax Margin": "income_after_tax_margin",
+    "Revenue/Total Assets": "revenue_to_total_assets",
+    "Long Term Debt/Equity": "long_term_debt_to_equity",
+    "Total Debt/Equity": "total_debt_to_equity",
+}
+
+# Biên dịch một lần khi nạp module: mỗi chỉ tiêu chỉ được lấy một lần, kết quả trung gian được dùng lại
+RATIO_PLAN = compile_formulas(formulas, labels, ratio_columns)
+
 # Hàm tính các chỉ số
 def calculate_financial_ratios(transposed_df):
-    total_current_assets = sum(get_values(transposed_df, label) for label in labels["total_current_assets"])
-    ppe = sum(get_values(transposed_df, label) for label in labels["ppe"])
-    total_assets = sum(get_values(transposed_df, label) for label in labels["total_assets"])
-    total_current_liabilities = get_values(transposed_df, labels["total_current_liabilities"][0])
-    total_long_term_debt = get_values(transposed_df, labels["total_long_term_debt"][0])
-    total_liabilities = get_values(transposed_df, labels["total_liabilities"][0])
-
-    # Tính EBITDA
-    net_income = get_values(transposed_df, labels["net_income"][0])
-    interest_expense = get_values(transposed_df, labels["interest_expense"][0])
-    taxes = get_values(transposed_df, labels["taxes"][0])
-    depreciation_amortization = get_values(transposed_df, labels["depreciation_amortization"][0])
-    ebitda = net_income + interest_expense + taxes + depreciation_amortization
-
-    # Tính Net Income Before Taxes
-    operating_profit = get_values(transposed_df, labels["operating_profit"][0])
-    other_profit = get_values(transposed_df, labels["other_profit"][0])
-    jv_profit = get_values(transposed_df, labels["jv_profit"][0])
-    net_income_before_taxes = operating_profit + other_profit + jv_profit
-
-    # Tính Net Income Before Extraordinary Items
-    other_income = get_values(transposed_df, labels["other_income"][0])
-    net_income_before_extraordinary_items = net_income + other_income
-
-    # Tính Total Operating Expense
-    revenue = get_values(transposed_df, labels["revenue"][0])
-    gross_profit = get_values(transposed_df, labels["gross_profit"][0])
-    financial_expense = get_values(transposed_df, labels["financial_expense"][0])
-    selling_expense = get_values(transposed_df, labels["selling_expense"][0])
-    admin_expense = get_values(transposed_df, labels["admin_expense"][0])
-    total_operating_expense = revenue - gross_profit + financial_expense + selling_expense + admin_expense
-
-    # Tính ROE, ROA, Income After Tax Margin, Revenue/Total Assets, Long Term Debt/Equity, Total Debt/Equity, ROS
-    total_equity = get_values(transposed_df, labels["total_equity"][0])
-    total_debt = get_values(transposed_df, labels["total_debt"][0])
-
-    roe = np.divide(net_income, total_equity, out=np.zeros_like(net_income), where=total_equity != 0)
-    roa = np.divide(net_income, total_assets, out=np.zeros_like(net_income), where=total_assets != 0)
-    income_after_tax_margin = np.divide(net_income, revenue, out=np.zeros_like(net_income), where=revenue != 0)
-    revenue_to_total_assets = np.divide(revenue, total_assets, out=np.zeros_like(revenue), where=total_assets != 0)
-    long_term_debt_to_equity = np.divide(total_long_term_debt, total_equity, out=np.zeros_like(total_long_term_debt), where=total_equity != 0)
-    total_debt_to_equity = np.divide(total_debt, total_equity, out=np.zeros_like(total_debt), where=total_equity != 0)
-    ros = np.divide(net_income, revenue, out=np.zeros_like(net_income), where=revenue != 0)
+    # Lấy tất cả các chỉ tiêu cần thiết trong một lần quét
+    rows = transposed_df[transposed_df["Chỉ tiêu"].isin(RATIO_PLAN["labels"])].drop_duplicates("Chỉ tiêu")
+    rows = rows.set_index("Chỉ tiêu")
+    zeros = np.zeros(len(transposed_df.columns[1:]))
+    ratios = evaluate_formulas(RATIO_PLAN, lambda label: rows.loc[label].to_numpy() if label in rows.index else zeros)
 
     # Lấy danh sách các năm
     years = transposed_df.columns[1:]
 
-    # Tạo DataFrame kết quả
-    financial_ratios = pd.DataFrame({
-        "Năm": years,
-        "Total Current Assets": [f"{value:,.2f}" for value in total_current_assets],
-        "Property/Plant/Equipment": [f"{value:,.2f}" for value in ppe],
-        "Total Assets": [f"{value:,.2f}" for value in total_assets],
-        "Total Current Liabilities": [f"{value:,.2f}" for value in total_current_liabilities],
-        "Total Long-Term Debt": [f"{value:,.2f}" for value in total_long_term_debt],
-        "Total Liabilities": [f"{value:,.2f}" for value in total_liabilities],
-        "EBITDA": [f"{value:,.2f}" for value in ebitda],
-        "Net Income Before Taxes": [f"{value:,.2f}" for value in net_income_before_taxes],
-        "Net Income Before Extraordinary Items": [f"{value:,.2f}" for value in net_income_before_extraordinary_items],
-        "Revenue": [f"{value:,.2f}" for value in revenue],
-        "Total Operating Expense": [f"{value:,.2f}" for value in total_operating_expense],
-        "Net Income After Taxes": [f"{value:,.2f}" for value in net_income],
-        "ROE": [f"{value * 100:,.2f}" for value in roe],
-        "ROA": [f"{value * 100:,.2f}" for value in roa],
-        "ROS": [f"{value * 100:,.2f}" for value in ros],
-        "Income After Tax Margin": [f"{value:,.2f}" for value in income_after_tax_margin],
-        "Revenue/Total Assets": [f"{value * 100:,.2f}" for value in revenue_to_total_assets],
-        "Long Term Debt/Equity": [f"{value * 100:,.2f}" for value in long_term_debt_to_equity],
-        "Total Debt/Equity": [f"{value * 100:,.2f}" for value in total_debt_to_equity],
-        "ROS": [f"{value * 100:,.2f}" for value in ros],
-    })
+    # Tạo DataFrame kết quả (giữ dạng số, chỉ định dạng chuỗi khi xuất báo cáo)
+    financial_ratios = pd.DataFrame({"Năm": years})
+    for name, values in ratios.items():
+        scale = 100 if name in PERCENT_RATIOS else 1
+        financial_ratios[name] = np.asarray(values, dtype=float) * scale
 
     return financial_ratios
+
+# Định dạng một giá trị để hiển thị; các giá trị lặp lại được lấy từ bộ nhớ đệm
+@lru_cache(maxsize=4096)
+def format_number(value):
+    return f"{value:,.2f}"
+
+# Năm mã không có báo cáo (NaN) được hiển thị là "-"
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return "-" if pd.isna(value) else format_number(float(value))
+
+# Chuyển panel (MÃ, NĂM) x chỉ tiêu thành mảng 3 chiều (công ty x năm x chỉ tiêu)
+def panel_to_array(panel):
+    tickers = panel.index.get_level_values(0).unique()
+    years = panel.index.get_level_values(1).unique().sort_values()
+    full_index = pd.MultiIndex.from_product([tickers, years], names=panel.index.names)
+    values = panel.reindex(full_index, fill_value=0).to_numpy(dtype=float)
+    return values.reshape(len(tickers), len(years), len(panel.columns)), tickers, years
+
+# Tính các công thức của một plan trên panel cho toàn bộ công ty cùng lúc (chỉ tiêu thiếu được tính là 0).
+# Trả về (dict tên -> mảng công ty x năm, danh sách mã, danh sách năm).
+def evaluate_panel(plan, panel):
+    values, tickers, years = panel_to_array(panel)
+    positions = {label: i for i, label in enumerate(panel.columns)}
+    zeros = np.zeros(values.shape[:2])
+    results = evaluate_formulas(plan, lambda label: values[:, :, positions[label]] if label in positions else zeros)
+    return results, tickers, years
+
+# Tính tất cả các chỉ số cho toàn bộ công ty trong một lần tính vector hóa
+def calculate_financial_ratios_many(panel):
+    """
+    panel: kết quả của readdata.process_financial_data_many, chỉ mục (MÃ, NĂM).
+    Trả về DataFrame số với chỉ mục (MÃ, NĂM), cùng đơn vị với bảng chỉ số của một công ty.
+    """
+    ratios, tickers, years = evaluate_panel(RATIO_PLAN, panel)
+
+    index = pd.MultiIndex.from_product([tickers, years], names=panel.index.names)
+    data = {}
+    for name, result in ratios.items():
+        scale = 100 if name in PERCENT_RATIOS else 1
+        data[name] = (result * scale).reshape(-1)
+    return pd.DataFrame(data, index=index)
@@ -0,0 +1,305 @@
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from filecache import evict_lru, temp_path
+
+# Tải cấu hình (API key, backend) từ file môi trường một lần khi nạp module
+load_dotenv()
+
+# Bộ nhớ đệm nhận xét AI: mỗi prompt (cùng cấu hình model) được lưu thành một file JSON
+COMMENTARY_CACHE_DIR = os.path.join("Data", "cache", "commentary")
+COMMENTARY_CACHE_MAX_BYTES = 50 * 1024 * 1024
+COMMENTARY_TTL = 7 * 24 * 3600  # giây
+
+# Backend mặc định; đặt COMMENTARY_BACKEND=stub trong .env để chạy không cần mạng/API key
+DEFAULT_BACKEND = "gemini"
+
+# Cấu hình model Google Gemini
+MODEL_NAME = "gemini-2.0-flash-exp"
+
+GENERATION_CONFIG = {
+    "temperature": 0,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+SYSTEM_INSTRUCTION = "Chatbot này sẽ hoạt động như một broker chứng khoán chuyên nghiệp..."
+
+# Cấu hình mặc định khi gọi nhận xét hàng loạt
+BATCH_CONCURRENCY = 4
+BATCH_RATE_PER_MINUTE = 30
+BATCH_RETRIES = 3
+BATCH_BACKOFF = 2.0  # giây, nhân đôi sau mỗi lần thử lại
+
+# Model Gemini đã cấu hình, tạo một lần cho mỗi tiến trình
+_models = {}
+
+
+def _get_gemini_model():
+    model = _models.get(MODEL_NAME)
+    if model is None:
+        import google.generativeai as genai
+
+        api_key = os.getenv("GEMINI_API_KEY")
+
+        # Kiểm tra xem API key có tồn tại không
+        if not api_key:
+            raise ValueError("API Key chưa được đặt. Vui lòng kiểm tra file .env")
+
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(
+            model_name=MODEL_NAME,
+            safety_settings=SAFETY_SETTINGS,
+            generation_config=GENERATION_CONFIG,
+            system_instruction=SYSTEM_INSTRUCTION,
+        )
+        _models[MODEL_NAME] = model
+    return model
+
+
+def _gemini_generate(prompt):
+    return _get_gemini_model().generate_content(prompt).text
+
+
+def _gemini_stream(prompt):
+    for chunk in _get_gemini_model().generate_content(prompt, stream=True):
+        yield chunk.text
+
+
+# Backend cục bộ: trả về nhận xét cố định theo prompt, không gọi mạng.
+# COMMENTARY_STUB_LATENCY (giây) giả lập độ trễ của API khi đo hiệu năng.
+def _stub_latency():
+    return float(os.getenv("COMMENTARY_STUB_LATENCY", "0"))
+
+
+def _stub_text(prompt):
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return (
+        "PHÂN TÍCH TÀI CHÍNH:\nNhận xét mẫu (backend stub) được tạo cục bộ, không gọi Gemini.\n\n"
+        "PHÂN TÍCH RỦI RO:\nKhông có đánh giá rủi ro thực tế trong chế độ stub.\n\n"
+        f"ĐÁNH GIÁ TRIỂN VỌNG ĐẦU TƯ:\nMã prompt: {digest}."
+    )
+
+
+def _stub_generate(prompt):
+    latency = _stub_latency()
+    if latency > 0:
+        time.sleep(latency)
+    return _stub_text(prompt)
+
+
+# Trả về từng từ, độ trễ được chia đều cho các từ như khi model sinh token
+def _stub_stream(prompt):
+    words = _stub_text(prompt).split(" ")
+    delay = _stub_latency() / len(words)
+    for i, word in enumerate(words):
+        if delay > 0:
+            time.sleep(delay)
+        yield word if i == len(words) - 1 else word + " "
+
+
+# Danh sách backend: tên -> hàm nhận prompt và trả về nhận xét
+BACKENDS = {
+    "gemini": _gemini_generate,
+    "stub": _stub_generate,
+}
+
+# Backend hỗ trợ trả về từng phần: tên -> hàm nhận prompt và sinh ra các đoạn văn bản
+STREAM_BACKENDS = {
+    "gemini": _gemini_stream,
+    "stub": _stub_stream,
+}
+
+
+# Thêm backend mới (ví dụ model chạy cục bộ); stream là tùy chọn
+def register_backend(name, generate, stream=None):
+    BACKENDS[name] = generate
+    if stream is not None:
+        STREAM_BACKENDS[name] = stream
+
+
+def _resolve_backend(backend):
+    if backend is None:
+        backend = os.getenv("COMMENTARY_BACKEND", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Không có backend nhận xét '{backend}'")
+    return backend
+
+
+# Khóa bộ nhớ đệm: mã băm của prompt, backend và toàn bộ cấu hình model
+def _cache_key(prompt, backend):
+    config = {
+        "backend": backend,
+        "model": MODEL_NAME,
+        "generation_config": GENERATION_CONFIG,
+        "safety_settings": SAFETY_SETTINGS,
+        "system_instruction": SYSTEM_INSTRUCTION,
+        "prompt": prompt,
+    }
+    return hashlib.sha256(json.dumps(config, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _cache_path(prompt, backend):
+    return os.path.join(COMMENTARY_CACHE_DIR, f"{_cache_key(prompt, backend)}.json")
+
+
+def _read_cached(path, ttl):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("created", 0) > ttl:
+        return None
+    os.utime(path)
+    return entry.get("text")
+
+
+def _write_cached(path, backend, text):
+    os.makedirs(COMMENTARY_CACHE_DIR, exist_ok=True)
+    # Tên file tạm riêng cho mỗi lần ghi: các luồng (phiên Streamlit, nhận xét hàng loạt) có thể ghi cùng prompt
+    temp_name = temp_path(path)
+    with open(temp_name, "w", encoding="utf-8") as f:
+        json.dump({"created": time.time(), "backend": backend, "model": MODEL_NAME, "text": text},
+                  f, ensure_ascii=False)
+    os.replace(temp_name, path)
+
+
+# Tạo nhận xét cho prompt, ưu tiên bộ nhớ đệm trên đĩa (hết hạn sau ttl giây)
+def generate_commentary(prompt, backend=None, ttl=COMMENTARY_TTL, use_cache=True):
+    backend = _resolve_backend(backend)
+    path = _cache_path(prompt, backend)
+    if use_cache:
+        text = _read_cached(path, ttl)
+        if text is not None:
+            return text
+
+    text = BACKENDS[backend](prompt)
+    if use_cache:
+        _write_cached(path, backend, text)
+        evict_lru(COMMENTARY_CACHE_DIR, ".json", COMMENTARY_CACHE_MAX_BYTES)
+    return text
+
+
+# Tạo nhận xét theo luồng: sinh ra từng đoạn văn bản ngay khi model trả về.
+# Nhận xét có trong bộ nhớ đệm được trả về trong một đoạn; backend không hỗ trợ luồng trả về cả bài.
+# Nhận xét chỉ được lưu vào bộ nhớ đệm khi luồng kết thúc trọn vẹn.
+def stream_commentary(prompt, backend=None, ttl=COMMENTARY_TTL, use_cache=True):
+    backend = _resolve_backend(backend)
+    path = _cache_path(prompt, backend)
+    if use_cache:
+        text = _read_cached(path, ttl)
+        if text is not None:
+            yield text
+            return
+
+    stream = STREAM_BACKENDS.get(backend)
+    chunks = []
+    for chunk in (stream(prompt) if stream is not None else [BACKENDS[backend](prompt)]):
+        chunks.append(chunk)
+        yield chunk
+
+    if use_cache:
+        _write_cached(path, backend, "".join(chunks))
+        evict_lru(COMMENTARY_CACHE_DIR, ".json", COMMENTARY_CACHE_MAX_BYTES)
+
+
+# Viết gọn một số cho prompt: tối đa 2 chữ số thập phân, không có dấu phân cách hàng nghìn
+def _compact_number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if math.isnan(value):
+        return "-"
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+# Bảng số liệu dạng gọn cho prompt: dòng đầu là tên cột, mỗi dòng sau là một chỉ tiêu, cột cách nhau bởi "|"
+def compact_table(rows, columns):
+    lines = ["|".join(["Chỉ tiêu", *map(str, columns)])]
+    for name, values in rows.items():
+        lines.append("|".join([name, *map(_compact_number, values)]))
+    return "\n".join(lines)
+
+
+# Bộ giới hạn tốc độ dùng chung giữa các luồng: các lần gọi cách nhau ít nhất 60/rate_per_minute giây
+def _rate_limiter(rate_per_minute):
+    interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+    lock = threading.Lock()
+    next_call = [time.monotonic()]
+
+    def wait():
+        with lock:
+            now = time.monotonic()
+            start = max(now, next_call[0])
+            next_call[0] = start + interval
+        if start > now:
+            time.sleep(start - now)
+
+    return wait
+
+
+# Tạo nhận xét cho nhiều prompt cùng lúc (ví dụ danh sách mã theo dõi).
+# Các prompt chưa có trong bộ nhớ đệm được gọi đồng thời trên tối đa max_concurrency luồng,
+# không quá rate_per_minute lần gọi mỗi phút; lỗi được thử lại tối đa retries lần, thời gian chờ
+# tăng theo cấp số nhân (backoff * 2^lần thử, có thêm ngẫu nhiên để các luồng không gọi lại cùng lúc).
+def generate_commentary_batch(prompts, backend=None, max_concurrency=BATCH_CONCURRENCY,
+                              rate_per_minute=BATCH_RATE_PER_MINUTE, retries=BATCH_RETRIES,
+                              backoff=BATCH_BACKOFF, ttl=COMMENTARY_TTL):
+    """
+    prompts: dict khóa (ví dụ mã cổ phiếu) -> prompt.
+    Trả về dict khóa -> nhận xét (None nếu vẫn lỗi sau khi thử lại).
+    """
+    backend = _resolve_backend(backend)
+    wait = _rate_limiter(rate_per_minute)
+
+    def run(key, prompt):
+        path = _cache_path(prompt, backend)
+        text = _read_cached(path, ttl)
+        if text is not None:
+            return text
+
+        for attempt in range(retries + 1):
+            wait()
+            try:
+                text = BACKENDS[backend](prompt)
+                break
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt * (1 + random.random())
+                print(f"⚠️ Lỗi khi tạo nhận xét cho {key} (lần {attempt + 1}), thử lại sau {delay:.1f} giây: {e}")
+                time.sleep(delay)
+
+        _write_cached(path, backend, text)
+        return text
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(prompts)))) as executor:
+        futures = {key: executor.submit(run, key, prompt) for key, prompt in prompts.items()}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"❌ Không thể tạo nhận xét cho {key}: {e}")
+                results[key] = None
+
+    if os.path.isdir(COMMENTARY_CACHE_DIR):
+        evict_lru(COMMENTARY_CACHE_DIR, ".json", COMMENTARY_CACHE_MAX_BYTES)
+    return results
@@ -0,0 +1,280 @@
+import os
+import re
+import glob
+import hashlib
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from concurrent.futures import ProcessPoolExecutor
+from search_index import build_name_index
+from filecache import source_signature, read_meta, write_meta
+
+# Thư mục chứa bộ nhớ đệm dạng cột (Parquet) của các file báo cáo tài chính theo năm
+CACHE_DIR = os.path.join("Data", "cache")
+
+# Cột tham chiếu: các cột phía sau cột này là số liệu tài chính
+START_COLUMN = "Trạng thái kiểm toán"
+
+
+# Chuyển đổi đơn vị
+def convert_units(df, factor, start_col):
+    try:
+        start_idx = df.columns.get_loc(start_col) + 1
+        numeric_cols = df.columns[start_idx:]
+        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce') / factor
+    except Exception as e:
+        print(f"⚠️ Lỗi khi chuyển đổi đơn vị: {e}")
+    return df
+
+# Chuẩn hóa tên cột
+def standardize_columns(df):
+    df = df.copy()
+    df.columns = df.columns.str.strip().str.replace("\n", " ").str.upper()
+    return df
+
+
+# Tìm tất cả các file "<năm>-Vietnam.xlsx" để trục năm không bị cố định
+def discover_years(directory="."):
+    years = []
+    for path in glob.glob(os.path.join(directory, "*-Vietnam.xlsx")):
+        match = re.fullmatch(r"(\d{4})-Vietnam\.xlsx", os.path.basename(path))
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+# Các cột số liệu thực sự được dùng: chỉ tiêu trong caculate.labels và trong các biểu đồ của drawchart
+def required_columns():
+    from caculate import labels
+    from drawchart import CHART_LABELS
+    columns = {label for group in labels.values() for label in group}
+    return sorted(columns | set(CHART_LABELS))
+
+
+# Bỏ năm, đơn vị, "Hợp nhất", "Quý: Hàng năm" khỏi tiêu đề cột gốc
+def _clean_header(name, year):
+    name = re.sub(f"Năm: {year}", "", str(name)).strip()
+    name = re.sub(r"Đơn vị: (Tỷ|Triệu) VND", "", name).strip()
+    name = re.sub(r"\bHợp nhất\b", "", name).strip()
+    name = re.sub(r"\bQuý: Hàng năm\b", "", name).strip()
+    return name
+
+
+# Đọc file Excel theo luồng (openpyxl read-only): chỉ giữ các cột định danh
+# (từ đầu đến cột "Trạng thái kiểm toán") và các cột số liệu được yêu cầu, bỏ qua phần còn lại
+def read_sheet_projected(source, year, columns):
+    columns = set(columns)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        header = next(rows)
+        cleaned = [_clean_header(name, year) for name in header]
+        start_idx = cleaned.index(START_COLUMN)
+        keep = [i for i, name in enumerate(cleaned)
+                if i <= start_idx or (name.replace("\n", " ").upper() in columns and "TM" not in name)]
+
+        data = []
+        for row in rows:
+            values = [row[i] if i < len(row) else None for i in keep]
+            if all(value is None for value in values):
+                continue
+            data.append([np.nan if value is None else value for value in values])
+    finally:
+        workbook.close()
+
+    return pd.DataFrame(data, columns=[header[i] for i in keep])
+
+
+# Làm sạch dữ liệu của một năm: tên cột, đơn vị, mã và tên công ty
+def clean_yearly_sheet(df, year):
+    # Xác định đơn vị từ tiêu đề gốc: các file ghi "Triệu VND" thực chất lưu số liệu theo VND
+    factor = 1e9 if any("Đơn vị: Triệu VND" in str(col) for col in df.columns) else 1
+    df.columns = [_clean_header(col, year) for col in df.columns]
+
+    # Xóa các cột không cần thiết
+    df = df.drop(columns=[col for col in df.columns if "TM" in col], errors='ignore')
+
+    # Chuyển đổi đơn vị về tỷ VND
+    if factor != 1:
+        df = convert_units(df, factor, START_COLUMN)
+
+    df = standardize_columns(df)
+    if 'MÃ' in df.columns and 'TÊN CÔNG TY' in df.columns:
+        df['MÃ'] = df['MÃ'].astype(str).str.strip().str.upper()
+        df['TÊN CÔNG TY'] = df['TÊN CÔNG TY'].astype(str).str.strip().str.upper()
+    return df
+
+
+# Tính mã băm SHA-256 của file nguồn
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_paths(source):
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(CACHE_DIR, f"{name}.parquet"), os.path.join(CACHE_DIR, f"{name}.json")
+
+
+# Kiểm tra bộ nhớ đệm còn khớp với file nguồn hay không.
+# So sánh mtime và kích thước trước, chỉ tính lại mã băm khi file đã bị chạm vào.
+def _is_cache_valid(source, data_path, meta_path, meta, columns):
+    if meta is None or not os.path.exists(data_path):
+        return False
+
+    # Danh sách cột cần thiết đã thay đổi (thêm chỉ tiêu mới) thì phải đọc lại
+    if meta.get("columns") != columns:
+        return False
+
+    stat = os.stat(source)
+    if meta.get("mtime") == stat.st_mtime and meta.get("size") == stat.st_size:
+        return True
+
+    if meta.get("sha256") != _file_hash(source):
+        return False
+
+    # Nội dung không đổi, chỉ cập nhật lại mtime để lần sau không phải băm lại
+    meta["mtime"], meta["size"] = stat.st_mtime, stat.st_size
+    write_meta(meta_path, meta)
+    return True
+
+
+def _write_cache(df, data_path):
+    try:
+        df.to_parquet(data_path, index=False)
+        return "parquet"
+    except ImportError:
+        # Không có pyarrow/fastparquet thì lưu dạng pickle
+        df.to_pickle(data_path)
+        return "pickle"
+
+
+def _read_cache(data_path, fmt):
+    if fmt == "pickle":
+        return pd.read_pickle(data_path)
+    return pd.read_parquet(data_path)
+
+
+# Đọc dữ liệu một năm, ưu tiên bộ nhớ đệm; chỉ parse lại Excel khi file nguồn thay đổi
+def load_yearly_sheet(year):
+    source = f"{year}-Vietnam.xlsx"
+    data_path, meta_path = _cache_paths(source)
+    meta = read_meta(meta_path)
+    columns = required_columns()
+
+    if _is_cache_valid(source, data_path, meta_path, meta, columns):
+        try:
+            return _read_cache(data_path, meta.get("format"))
+        except Exception as e:
+            print(f"⚠️ Bộ nhớ đệm năm {year} bị lỗi, đang đọc lại từ Excel: {e}")
+
+    df = read_sheet_projected(source, year, columns)
+    df = clean_yearly_sheet(df, year)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    stat = os.stat(source)
+    fmt = _write_cache(df, data_path)
+    write_meta(meta_path, {
+        "source": source,
+        "sha256": _file_hash(source),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "format": fmt,
+        "columns": columns,
+    })
+    print(f"✅ Đã tạo bộ nhớ đệm cho {source}")
+    return df
+
+
+# Kiểm tra dữ liệu một năm đã có trong bộ nhớ đệm và còn hợp lệ hay chưa
+def is_year_cached(year):
+    source = f"{year}-Vietnam.xlsx"
+    data_path, meta_path = _cache_paths(source)
+    return _is_cache_valid(source, data_path, meta_path, read_meta(meta_path), required_columns())
+
+
+# Đọc dữ liệu tất cả các năm.
+# Các file cần parse lại Excel được chia cho nhóm tiến trình (mỗi file một worker),
+# kết quả luôn được sắp xếp theo thứ tự năm.
+def load_yearly_data(years=None, max_workers=None):
+    years = discover_years() if years is None else list(years)
+    stale = [year for year in years if not is_year_cached(year)]
+
+    results = {}
+    workers = min(len(stale), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = dict(zip(stale, executor.map(load_yearly_sheet, stale)))
+        except Exception as e:
+            print(f"⚠️ Không thể đọc song song, chuyển sang đọc tuần tự: {e}")
+            results = {}
+
+    return [results[year] if year in results else load_yearly_sheet(year) for year in years]
+
+
+# Bộ nhớ trong tiến trình: dữ liệu đã làm sạch và các chỉ mục, dựng lại khi dữ liệu đổi phiên bản
+_store = {}
+
+
+# Phiên bản dữ liệu được xác định bởi mtime và kích thước của các file nguồn
+def _source_signature(years):
+    sources = [f"{year}-Vietnam.xlsx" for year in years]
+    signature = source_signature(sources)
+    if signature is None:
+        raise FileNotFoundError(f"Không tìm thấy file báo cáo tài chính: {', '.join(sources)}")
+    return signature
+
+
+# Chỉ mục mã cổ phiếu -> danh sách (năm, vị trí dòng) trên tất cả các năm
+def build_ticker_index(dfs, years):
+    index = {}
+    for year, df in zip(years, dfs):
+        if 'MÃ' not in df.columns:
+            continue
+        for pos, ticker in enumerate(df['MÃ'].to_numpy()):
+            index.setdefault(ticker, []).append((year, pos))
+    return index
+
+
+# Lấy dữ liệu và chỉ mục, chỉ đọc lại khi file nguồn thay đổi.
+# Khi có file năm mới (ví dụ 2025-Vietnam.xlsx), chỉ năm đó được đọc; các năm cũ dùng lại dữ liệu trong bộ nhớ.
+def get_fundamentals(years=None):
+    years = tuple(discover_years() if years is None else years)
+    signature = _source_signature(years)
+    store = _store.get("current")
+    if store is not None and store["signature"] == signature:
+        return store
+
+    previous = dict(zip(store["signature"], store["dfs"])) if store is not None else {}
+    changed = [year for year, key in zip(years, signature) if key not in previous]
+    loaded = dict(zip(changed, load_yearly_data(changed)))
+    dfs = [previous[key] if key in previous else loaded[year] for year, key in zip(years, signature)]
+
+    store = {
+        "signature": signature,
+        "years": years,
+        "dfs": dfs,
+        "ticker_index": build_ticker_index(dfs, years),
+    }
+    _store["current"] = store
+    return store
+
+
+# Dữ liệu đang có trong bộ nhớ tiến trình (None nếu chưa đọc), không đọc file và không kiểm tra phiên bản
+def loaded_fundamentals():
+    return _store.get("current")
+
+
+# Chỉ mục tên công ty chỉ được dựng khi cần tìm theo tên, rồi được giữ cùng phiên bản dữ liệu
+def get_name_index(store=None):
+    store = get_fundamentals() if store is None else store
+    if "name_index" not in store:
+        store["name_index"] = build_name_index(store["dfs"], store["years"])
+    return store["name_index"]
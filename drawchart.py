@@ -1,26 +1,44 @@
-import matplotlib.pyplot as plt
+import io
+import os
+import hashlib
 import numpy as np
-from caculate import calculate_financial_ratios
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from filecache import evict_lru, temp_path
+
+# Biểu đồ được in rộng 120 mm trong PDF; DPI của ảnh được tính từ chiều rộng figure
+# để đạt độ phân giải in mong muốn, thay vì cố định 300 dpi cho figure rộng 10-14 inch
+PRINT_WIDTH_MM = 120
+PRINT_DPI = 300
+
+# Bộ nhớ đệm biểu đồ theo nội dung: khóa là mã băm của số liệu đầu vào và tham số vẽ.
+# Dung lượng tối đa (MB) đặt bằng biến môi trường CHART_CACHE_MAX_MB; mặc định lớn hơn một lần
+# vẽ toàn thị trường (khoảng 440 MB) để render_all hằng đêm không tự xóa biểu đồ vừa vẽ.
+CHART_CACHE_DIR = os.path.join("images", "cache")
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# Tăng số này khi thay đổi cách vẽ để bỏ các biểu đồ cũ trong bộ nhớ đệm
+CHART_STYLE_VERSION = 1
+
+# Các chỉ tiêu được dùng để vẽ biểu đồ (datastore chỉ đọc các cột này và caculate.labels)
+CHART_LABELS = [
+    "KQKD. DOANH THU THUẦN",
+    "CĐKT. TỔNG CỘNG TÀI SẢN",
+    "CĐKT. VỐN CHỦ SỞ HỮU",
+    "CĐKT. TÀI SẢN NGẮN HẠN",
+    "CĐKT. TÀI SẢN DÀI HẠN",
+    "KQKD. LỢI NHUẬN SAU THUẾ THU NHẬP DOANH NGHIỆP",
+]
 
 # Hàm lấy giá trị từ transposed_df, luôn trả về mảng numpy hợp lệ
 def get_values(transposed_df, label):
     row = transposed_df[transposed_df["Chỉ tiêu"] == label]
     if row.empty:
         return np.zeros(len(transposed_df.columns[1:]), dtype=float)
-    values = row.iloc[:, 1:].fillna(0).values.flatten()
-    return np.array(values, dtype=float)
-
-# Hàm vẽ biểu đồ
-def draw_chart(stock_code):
-    # Lấy và xử lý dữ liệu
-    from readdata import process_financial_data
-    transposed_df = process_financial_data(stock_code)
-    if transposed_df.empty:
-        print(f"Không tìm thấy dữ liệu cho mã cổ phiếu {stock_code}")
-        return
-
-    financial_ratios = calculate_financial_ratios(transposed_df)
+    # Năm không có báo cáo (NaN) được vẽ là 0
+    return np.nan_to_num(row.iloc[:, 1:].to_numpy(dtype=float).flatten())
 
+# Biểu đồ doanh thu, tổng tài sản, vốn chủ sở hữu
+def plot_revenue_assets_equity(fig, transposed_df, stock_code):
     years = transposed_df.columns[1:]
     sales_revenue = np.round(get_values(transposed_df, "KQKD. DOANH THU THUẦN")).astype(int)
     total_assets = np.round(get_values(transposed_df, "CĐKT. TỔNG CỘNG TÀI SẢN")).astype(int)
@@ -30,73 +48,63 @@ def draw_chart(stock_code):
     bar_width = 0.25
     x = np.arange(len(years))
 
-    plt.figure(figsize=(12, 6))
-    plt.bar(x - bar_width, sales_revenue, width=bar_width, color=colors["sales_revenue"], label="Sales Revenue", zorder=3)
-    plt.bar(x, total_assets, width=bar_width, color=colors["total_assets"], label="Total Assets", zorder=3)
-    plt.bar(x + bar_width, equity, width=bar_width, color=colors["equity"], label="Equity", zorder=3)
+    ax = fig.add_subplot()
+    ax.bar(x - bar_width, sales_revenue, width=bar_width, color=colors["sales_revenue"], label="Sales Revenue", zorder=3)
+    ax.bar(x, total_assets, width=bar_width, color=colors["total_assets"], label="Total Assets", zorder=3)
+    ax.bar(x + bar_width, equity, width=bar_width, color=colors["equity"], label="Equity", zorder=3)
 
-    plt.ylim(0, max(max(sales_revenue), max(total_assets), max(equity)) * 1.15)
+    ax.set_ylim(0, max(max(sales_revenue), max(total_assets), max(equity)) * 1.15)
     for i in range(len(years)):
-        plt.text(x[i] - bar_width, sales_revenue[i] * 1.01, f"{sales_revenue[i]:,}", ha="center", fontsize=9, color="black", fontweight="bold")
-        plt.text(x[i], total_assets[i] * 1.01, f"{total_assets[i]:,}", ha="center", fontsize=9, color="black", fontweight="bold")
-        plt.text(x[i] + bar_width, equity[i] * 1.01, f"{equity[i]:,}", ha="center", fontsize=9, color="black", fontweight="bold")
-
-    plt.title(f"Revenue, Total Assets, Equity of {stock_code}", fontsize=16, weight="bold")
-    plt.xticks(x, years, fontweight="bold", fontsize=12)
-
-    plt.gca().spines["top"].set_visible(False)
-    plt.gca().spines["right"].set_visible(False)
-    plt.gca().spines["left"].set_visible(False)
-
-    plt.tick_params(axis="y", labelsize=12, left=False)
-    plt.legend(loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=3)
-    plt.grid(axis="y", linestyle="--", alpha=0.3, zorder=0)
-
-    import os
-    output_dir = "images/output"
-    os.makedirs(output_dir, exist_ok=True)
-    file_name = os.path.join(output_dir, f"revenue_totalassets_equity_{stock_code}.png")
-    plt.savefig(file_name, format="png", dpi=300)
-    print(f"Biểu đồ đã được lưu tại {file_name}")
-
-    plt.show()
-    
-    # Vẽ biểu đồ cấu trúc tài sản
+        ax.text(x[i] - bar_width, sales_revenue[i] * 1.01, f"{sales_revenue[i]:,}", ha="center", fontsize=9, color="black", fontweight="bold")
+        ax.text(x[i], total_assets[i] * 1.01, f"{total_assets[i]:,}", ha="center", fontsize=9, color="black", fontweight="bold")
+        ax.text(x[i] + bar_width, equity[i] * 1.01, f"{equity[i]:,}", ha="center", fontsize=9, color="black", fontweight="bold")
+
+    ax.set_title(f"Revenue, Total Assets, Equity of {stock_code}", fontsize=16, weight="bold")
+    ax.set_xticks(x)
+    ax.set_xticklabels(years, fontweight="bold", fontsize=12)
+
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.spines["left"].set_visible(False)
+
+    ax.tick_params(axis="y", labelsize=12, left=False)
+    ax.legend(loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=3)
+    ax.grid(axis="y", linestyle="--", alpha=0.3, zorder=0)
+
+# Biểu đồ cấu trúc tài sản
+def plot_asset_structure(fig, transposed_df, stock_code):
+    years = transposed_df.columns[1:]
+    x = np.arange(len(years))
     ts_ngan_han = get_values(transposed_df, "CĐKT. TÀI SẢN NGẮN HẠN")
     ts_dai_han = get_values(transposed_df, "CĐKT. TÀI SẢN DÀI HẠN")
     total_assets = ts_ngan_han + ts_dai_han
     current_assets = np.round((ts_ngan_han / total_assets) * 100, 1)
     non_current_assets = np.round((ts_dai_han / total_assets) * 100, 1)
 
-    plt.figure(figsize=(14, 6))
-    plt.bar(x, current_assets, color="#003f87", edgecolor='white', width=0.5, label="Current Assets", zorder=3)
-    plt.bar(x, non_current_assets, bottom=current_assets, color="#ffc000", edgecolor='white', width=0.5, label="Non-current Assets", zorder=3)
+    ax = fig.add_subplot()
+    ax.bar(x, current_assets, color="#003f87", edgecolor='white', width=0.5, label="Current Assets", zorder=3)
+    ax.bar(x, non_current_assets, bottom=current_assets, color="#ffc000", edgecolor='white', width=0.5, label="Non-current Assets", zorder=3)
 
     for i in range(len(x)):
-        plt.text(x[i], current_assets[i] / 2, f"{current_assets[i]}%", ha='center', va='center', color='white', fontsize=12, fontweight="bold", zorder=4)
-        plt.text(x[i], current_assets[i] + non_current_assets[i] / 2, f"{non_current_assets[i]}%", ha='center', va='center', color='black', fontsize=12, fontweight="bold", zorder=4)
-
-    plt.title("ASSET STRUCTURE", fontsize=16, weight="bold")
-    plt.xticks(x, years, fontweight="bold")
-    plt.ylim(0, 100)
+        ax.text(x[i], current_assets[i] / 2, f"{current_assets[i]}%", ha='center', va='center', color='white', fontsize=12, fontweight="bold", zorder=4)
+        ax.text(x[i], current_assets[i] + non_current_assets[i] / 2, f"{non_current_assets[i]}%", ha='center', va='center', color='black', fontsize=12, fontweight="bold", zorder=4)
 
-    plt.gca().spines["top"].set_visible(False)
-    plt.gca().spines["right"].set_visible(False)
-    plt.gca().spines["left"].set_visible(False)
+    ax.set_title("ASSET STRUCTURE", fontsize=16, weight="bold")
+    ax.set_xticks(x)
+    ax.set_xticklabels(years, fontweight="bold")
+    ax.set_ylim(0, 100)
 
-    plt.gca().set_yticks([])
-    plt.gca().tick_params(axis='y', which='both', left=False)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.spines["left"].set_visible(False)
 
-    plt.legend(loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=2)
+    ax.set_yticks([])
+    ax.tick_params(axis='y', which='both', left=False)
 
-    file_name = os.path.join(output_dir, f"asset_structure_{stock_code}.png")
-    plt.tight_layout()
-    plt.savefig(file_name, format="png", dpi=300)
-    print(f"Biểu đồ cấu trúc tài sản đã được lưu tại {file_name}")
+    ax.legend(loc='lower center', bbox_to_anchor=(0.5, -0.15), ncol=2)
 
-    plt.tight_layout()
-    plt.show()
-    #Vẽ biểu đồ Biểu đồ Equity, ROE & ROA
+# Biểu đồ Equity, ROE & ROA
+def plot_equity_roe_roa(fig, transposed_df, stock_code):
     # Lấy dữ liệu
     years = transposed_df.columns[1:]
     equity = np.round(get_values(transposed_df, "CĐKT. VỐN CHỦ SỞ HỮU")).astype(int)
@@ -116,8 +124,7 @@ def draw_chart(stock_code):
     # Màu sắc
     colors = {"equity": "#003f87", "roe": "#f57c00", "roa": "#ffc000"}
 
-    # Vẽ biểu đồ
-    fig, ax1 = plt.subplots(figsize=(14, 6))
+    ax1 = fig.add_subplot()
 
     # Cột Equity
     ax1.bar(years, equity, color=colors["equity"], edgecolor='white', width=0.4, label="Equity", zorder=3)
@@ -148,7 +155,7 @@ def draw_chart(stock_code):
         ax2.text(i, roa[i] - 2, f'{roa[i]:.1f}%', ha='center', va='top', color=colors["roa"], fontsize=11, fontweight='bold')
 
     # Thiết lập tiêu đề và trục x
-    plt.title("EQUITY, ROE & ROA OF THE GROUP OVER YEARS", fontsize=16, weight="bold", fontname="Arial")
+    ax2.set_title("EQUITY, ROE & ROA OF THE GROUP OVER YEARS", fontsize=16, weight="bold", fontname="Arial")
     ax1.set_xticks(np.arange(len(years)))
     ax1.set_xticklabels([f'{year}' for year in years], fontweight='bold', fontsize=12)
 
@@ -157,20 +164,10 @@ def draw_chart(stock_code):
     lines2, labels2 = ax2.get_legend_handles_labels()
     ax2.legend(lines1 + lines2, labels1 + labels2, loc='lower center', bbox_to_anchor=(0.5, -0.2), ncol=3, fontsize=11)
 
-    # Lưu biểu đồ
-    import os
-    output_dir = "images/output"
-    os.makedirs(output_dir, exist_ok=True)
-    file_name = os.path.join(output_dir, f"equity_roe_roa_{stock_code}.png")
-    plt.tight_layout()
-    plt.savefig(file_name, format="png", dpi=300)
-    print(f"Biểu đồ Equity, ROE & ROA đã được lưu tại {file_name}")
-
-    # Hiển thị biểu đồ
-    plt.tight_layout()
-    plt.show()
-   #Vẽ biểu đồ Income After Tax Margin
+# Biểu đồ Income After Tax Margin
+def plot_income_after_tax_margin(fig, transposed_df, stock_code):
     # Lấy dữ liệu lợi nhuận và doanh thu
+    years = transposed_df.columns[1:]
     net_income = get_values(transposed_df, "KQKD. LỢI NHUẬN SAU THUẾ THU NHẬP DOANH NGHIỆP")
     revenue = get_values(transposed_df, "KQKD. DOANH THU THUẦN")
 
@@ -178,15 +175,6 @@ def draw_chart(stock_code):
     income_after_tax_margin = np.divide(net_income, revenue, out=np.zeros_like(net_income), where=revenue != 0) * 100
     income_after_tax_margin = np.round(income_after_tax_margin, 1)
 
-    # Lọc ra các năm 2020-2024
-    selected_years = ["2020", "2021", "2022", "2023", "2024"]
-    mask = np.isin(years, selected_years)
-
-    years = years[mask]
-    net_income = net_income[mask]
-    revenue = revenue[mask]
-    income_after_tax_margin = income_after_tax_margin[mask]
-
     # Màu sắc
     colors = {
         "revenue": "#003f87",
@@ -194,8 +182,7 @@ def draw_chart(stock_code):
         "margin": "#f57c00"
     }
 
-    # Tạo biểu đồ
-    fig, ax1 = plt.subplots(figsize=(10, 6))
+    ax1 = fig.add_subplot()
 
     # Vẽ cột doanh thu và lợi nhuận
     bar_width = 0.4
@@ -224,7 +211,7 @@ def draw_chart(stock_code):
         ax2.text(x[i], income_after_tax_margin[i] + 1, f'{income_after_tax_margin[i]:.1f}%', ha='center', color=colors["margin"], fontweight='bold', fontsize=10)
 
     # Thiết lập tiêu đề và nhãn trục X
-    plt.title("INCOME AFTER TAX MARGIN", fontsize=14, weight="bold")
+    ax2.set_title("INCOME AFTER TAX MARGIN", fontsize=14, weight="bold")
     ax1.set_xticks(x)
     ax1.set_xticklabels(years, fontweight='bold', fontsize=12)
 
@@ -249,16 +236,121 @@ def draw_chart(stock_code):
     # Đường lưới ngang nhẹ
     ax1.grid(axis='y', linestyle='--', alpha=0.5, zorder=1)
 
-    # Lưu biểu đồ
-    import os
-    output_dir = "images/output"
-    os.makedirs(output_dir, exist_ok=True)
-    file_name = os.path.join(output_dir, f"income_after_tax_margin_{stock_code}.png")
-    plt.tight_layout()
-    plt.savefig(file_name, format="png", dpi=300)
-    print(f"Biểu đồ Income After Tax Margin đã được lưu thành công tại {file_name}")
-
-    # Hiển thị biểu đồ
-    plt.tight_layout()
-    plt.show()
-
+# Danh sách biểu đồ của báo cáo: (tên biểu đồ, kích thước, hàm vẽ, có dùng tight_layout)
+CHARTS = [
+    ("revenue_totalassets_equity", (12, 6), plot_revenue_assets_equity, False),
+    ("asset_structure", (14, 6), plot_asset_structure, True),
+    ("equity_roe_roa", (14, 6), plot_equity_roe_roa, True),
+    ("income_after_tax_margin", (10, 6), plot_income_after_tax_margin, True),
+]
+
+# DPI của ảnh để figure rộng figsize[0] inch đạt print_dpi khi in rộng width_mm
+def print_dpi(figsize, width_mm=PRINT_WIDTH_MM, dpi=PRINT_DPI):
+    return round(dpi * width_mm / 25.4 / figsize[0])
+
+# Khóa bộ nhớ đệm của một biểu đồ: số liệu các chỉ tiêu được vẽ, mã cổ phiếu (tiêu đề) và tham số vẽ
+def _chart_key(name, transposed_df, stock_code, figsize, tight, dpi):
+    rows = transposed_df[transposed_df["Chỉ tiêu"].isin(CHART_LABELS)].sort_values("Chỉ tiêu")
+    digest = hashlib.sha256()
+    digest.update(repr((CHART_STYLE_VERSION, name, stock_code, figsize, tight, dpi, list(rows.columns))).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(rows.astype(str), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Vẽ các biểu đồ của một mã vào bộ nhớ đệm; biểu đồ có số liệu không đổi không chạy lại matplotlib.
+# Mặc định chạy ở chế độ nền (không gọi plt.show), mọi figure được giải phóng sau khi vẽ.
+# Trả về dict: tên biểu đồ -> đường dẫn file PNG trong bộ nhớ đệm (None nếu không có dữ liệu).
+# dpi=None thì tính theo print_dpi cho từng biểu đồ.
+# context: kết quả của report.build_report_context, dùng lại dữ liệu đã lấy cho báo cáo.
+def render_charts(stock_code, show=False, dpi=None, context=None):
+    # Lấy và xử lý dữ liệu
+    if context is None:
+        from report import build_report_context
+        context = build_report_context(stock_code)
+    if context is None:
+        print(f"Không tìm thấy dữ liệu cho mã cổ phiếu {stock_code}")
+        return None
+    transposed_df = context["transposed_df"]
+
+    os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+    paths = {}
+    for name, figsize, plot, tight in CHARTS:
+        chart_dpi = dpi or print_dpi(figsize)
+        cached = os.path.join(CHART_CACHE_DIR, f"{_chart_key(name, transposed_df, stock_code, figsize, tight, chart_dpi)}.png")
+        paths[name] = cached
+        if not show and os.path.exists(cached):
+            os.utime(cached)
+            continue
+
+        # matplotlib chỉ được nạp khi có biểu đồ phải vẽ (trúng bộ nhớ đệm thì không cần).
+        # Chế độ nền dùng Figure (canvas Agg): không đăng ký vào pyplot nên không cần màn hình
+        # và được giải phóng ngay sau khi vẽ; chỉ chế độ hiển thị mới dùng pyplot
+        if show:
+            import matplotlib.pyplot as plt
+        else:
+            from matplotlib.figure import Figure
+        fig = plt.figure(figsize=figsize) if show else Figure(figsize=figsize)
+        try:
+            plot(fig, transposed_df, stock_code)
+            if tight:
+                fig.tight_layout()
+
+            # Ghi vào file tạm (tên riêng cho mỗi lần ghi) rồi đổi tên để các tiến trình và các phiên
+            # Streamlit (luồng trong cùng tiến trình) vẽ song song không đọc phải file dở dang
+            temp_name = temp_path(cached)
+            fig.savefig(temp_name, format="png", dpi=chart_dpi)
+            os.replace(temp_name, cached)
+
+            if show:
+                plt.show()
+        finally:
+            if show:
+                plt.close(fig)
+    return paths
+
+# Đọc các biểu đồ từ bộ nhớ đệm khi cần dùng: tên biểu đồ -> ảnh PNG trong bộ nhớ (io.BytesIO)
+def load_charts(paths):
+    charts = {}
+    for name, path in paths.items():
+        with open(path, "rb") as f:
+            charts[name] = io.BytesIO(f.read())
+    return charts
+
+# Hàm vẽ biểu đồ cho báo cáo một mã.
+# Trả về dict: tên biểu đồ -> ảnh PNG trong bộ nhớ (io.BytesIO), dùng trực tiếp cho pdf.image.
+def draw_chart(stock_code, show=False, dpi=None, context=None):
+    paths = render_charts(stock_code, show, dpi, context)
+    if paths is None:
+        return None
+    charts = load_charts(paths)
+    evict_lru(CHART_CACHE_DIR, ".png", CHART_CACHE_MAX_BYTES)
+    return charts
+
+# Vẽ biểu đồ cho một mã trong tiến trình con, lỗi của một mã không làm dừng cả lô.
+# Chỉ trả về đường dẫn trong bộ nhớ đệm, không gửi ảnh về tiến trình cha.
+def _render_one(stock_code):
+    try:
+        return render_charts(stock_code)
+    except Exception as e:
+        print(f"⚠️ Lỗi khi vẽ biểu đồ cho {stock_code}: {e}")
+        return None
+
+# Vẽ biểu đồ cho nhiều mã cổ phiếu vào bộ nhớ đệm, chia cho nhóm tiến trình (mỗi mã một tác vụ).
+# Bộ nhớ đệm chỉ được dọn một lần sau khi vẽ xong cả lô (giới hạn max_bytes).
+# Trả về dict: mã cổ phiếu -> dict tên biểu đồ -> đường dẫn PNG (None nếu không có dữ liệu hoặc bị lỗi);
+# đọc ảnh khi cần bằng load_charts.
+def render_all(tickers, max_workers=None, max_bytes=CHART_CACHE_MAX_BYTES):
+    tickers = list(dict.fromkeys(str(ticker).strip().upper() for ticker in tickers))
+    workers = min(len(tickers), max_workers or os.cpu_count() or 1)
+    results = None
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = dict(zip(tickers, executor.map(_render_one, tickers, chunksize=8)))
+        except Exception as e:
+            print(f"⚠️ Không thể vẽ song song, chuyển sang vẽ tuần tự: {e}")
+
+    if results is None:
+        results = {ticker: _render_one(ticker) for ticker in tickers}
+    if os.path.isdir(CHART_CACHE_DIR):
+        evict_lru(CHART_CACHE_DIR, ".png", max_bytes)
+    return results
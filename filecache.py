@@ -0,0 +1,55 @@
+import os
+import json
+import uuid
+
+# Các hàm dùng chung cho bộ nhớ đệm trên đĩa
+
+
+# Phiên bản của các file nguồn: ((đường dẫn, mtime, kích thước), ...); None nếu thiếu file
+def source_signature(paths):
+    signature = []
+    for path in paths:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime, stat.st_size))
+    return tuple(signature)
+
+
+# Tên file tạm duy nhất cạnh `path` (khác nhau giữa các tiến trình và các luồng): ghi xong rồi os.replace sang path
+def temp_path(path):
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+# Đọc file JSON mô tả bộ nhớ đệm; None nếu chưa có hoặc file bị hỏng
+def read_meta(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(meta_path, meta):
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+# Thư mục bộ nhớ đệm giới hạn dung lượng: khi tổng dung lượng các file có đuôi `suffix` vượt quá max_bytes,
+# xóa các file ít được dùng gần đây nhất (theo mtime; đọc từ bộ nhớ đệm thì cập nhật mtime bằng os.utime)
+def evict_lru(directory, suffix, max_bytes):
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
@@ -0,0 +1,101 @@
+import ast
+import numpy as np
+
+# Ngôn ngữ công thức đơn giản cho các chỉ số tài chính, ví dụ: "roe = net_income / total_equity".
+# Các công thức được biên dịch thành một danh sách bước tính theo thứ tự phụ thuộc (DAG):
+# mỗi chỉ tiêu chỉ được lấy một lần, biểu thức con giống nhau chỉ được tính một lần.
+
+_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+
+
+# Tách "tên = biểu thức" thành (tên, cây cú pháp của biểu thức)
+def _parse(formula):
+    name, sep, expression = formula.partition("=")
+    name = name.strip()
+    if not sep or not name.isidentifier():
+        raise ValueError(f"Công thức không hợp lệ: '{formula}'")
+    return name, ast.parse(expression.strip(), mode="eval").body
+
+
+# Biên dịch các công thức thành kế hoạch tính toán
+def compile_formulas(formulas, labels, outputs):
+    """
+    formulas: danh sách chuỗi "tên = biểu thức" (+, -, *, /, số, tên biến).
+    labels: tên biến -> danh sách chỉ tiêu gốc (nhiều chỉ tiêu thì được cộng lại).
+    outputs: tên cột kết quả -> tên biến.
+    """
+    definitions = dict(_parse(formula) for formula in formulas)
+    steps = []
+    emitted = set()
+    resolved = {}
+    fetched = []
+
+    def emit(key, op, args):
+        if key not in emitted:
+            emitted.add(key)
+            steps.append((key, op, args))
+        return key
+
+    def resolve(name, visiting):
+        if name in resolved:
+            return resolved[name]
+        if name in visiting:
+            raise ValueError(f"Công thức bị lặp vòng tại '{name}'")
+
+        if name in definitions:
+            key = compile_node(definitions[name], visiting | {name})
+        elif name in labels:
+            keys = []
+            for label in labels[name]:
+                if label not in fetched:
+                    fetched.append(label)
+                keys.append(emit(f"[{label}]", "fetch", label))
+            key = keys[0] if len(keys) == 1 else emit(f"sum({', '.join(keys)})", "sum", keys)
+        else:
+            raise ValueError(f"Không tìm thấy chỉ tiêu hoặc công thức '{name}'")
+
+        resolved[name] = key
+        return key
+
+    def compile_node(node, visiting):
+        if isinstance(node, ast.Name):
+            return resolve(node.id, visiting)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return emit(repr(node.value), "const", node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = compile_node(node.operand, visiting)
+            return emit(f"(-{operand})", "neg", [operand])
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            op = _OPERATORS[type(node.op)]
+            left = compile_node(node.left, visiting)
+            right = compile_node(node.right, visiting)
+            return emit(f"({left} {op} {right})", op, [left, right])
+        raise ValueError(f"Biểu thức không được hỗ trợ: {ast.dump(node)}")
+
+    output_keys = {column: resolve(name, frozenset()) for column, name in outputs.items()}
+    return {"labels": fetched, "steps": steps, "outputs": output_keys}
+
+
+# Tính các chỉ số theo kế hoạch đã biên dịch; get(label) trả về mảng số liệu của chỉ tiêu
+def evaluate_formulas(plan, get):
+    values = {}
+    for key, op, args in plan["steps"]:
+        if op == "fetch":
+            values[key] = np.asarray(get(args), dtype=float)
+        elif op == "const":
+            values[key] = args
+        elif op == "sum":
+            values[key] = sum(values[arg] for arg in args)
+        elif op == "neg":
+            values[key] = -values[args[0]]
+        elif op == "+":
+            values[key] = values[args[0]] + values[args[1]]
+        elif op == "-":
+            values[key] = values[args[0]] - values[args[1]]
+        elif op == "*":
+            values[key] = values[args[0]] * values[args[1]]
+        elif op == "/":
+            # Chia an toàn: mẫu số bằng 0 thì kết quả bằng 0
+            numerator, denominator = np.broadcast_arrays(values[args[0]], values[args[1]])
+            values[key] = np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator != 0)
+    return {column: values[key] for column, key in plan["outputs"].items()}
@@ -0,0 +1,224 @@
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+# Chỉ báo kỹ thuật cho toàn bộ thị trường trên ma trận (mã × ngày) của pricestore.
+# Mỗi chỉ báo được tính dọc theo trục ngày cho tất cả các mã cùng lúc, với cùng công thức
+# của thư viện ta mà compute_timeseries_indicators (WEB.py) dùng cho từng mã.
+MA_PERIODS = [20, 50, 100, 200]
+RSI_PERIODS = [9, 14, 21]
+CCI_PERIODS = [10, 20, 30]
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BOLLINGER_WINDOW, BOLLINGER_DEV = 20, 2
+MFI_WINDOW = 14
+PSAR_STEP, PSAR_MAX_STEP = 0.02, 0.20
+
+# Số ngày gần nhất được giữ bảng snapshot trong bộ nhớ (máy chủ Streamlit chạy lâu dài)
+SNAPSHOT_CACHE_SIZE = 8
+
+
+# Giá mở, cao, thấp suy ra từ giá đóng cửa như get_stock_timeseries:
+# open là giá đóng cửa phiên trước (thiếu thì bằng close), high/low là max/min của open và close
+def ohlc_from_close(close):
+    open_price = np.concatenate([close[:, :1], close[:, :-1]], axis=1)
+    open_price = np.where(np.isnan(open_price), close, open_price)
+    return open_price, np.fmax(open_price, close), np.fmin(open_price, close)
+
+
+# Cửa sổ `window` ngày cuối cùng; None nếu chưa đủ số ngày
+def _last_window(values, window, end=None):
+    end = values.shape[1] if end is None else end
+    if end < window:
+        return None
+    return values[:, end - window:end]
+
+
+# Trung bình trượt (min_periods = window): NaN nếu cửa sổ có ngày thiếu số liệu
+def _last_mean(values, window):
+    block = _last_window(values, window)
+    return np.full(values.shape[0], np.nan) if block is None else block.mean(axis=1)
+
+
+def _last_std(values, window, ddof):
+    block = _last_window(values, window)
+    return np.full(values.shape[0], np.nan) if block is None else block.std(axis=1, ddof=ddof)
+
+
+def _last_sum(values, window, end=None):
+    block = _last_window(values, window, end)
+    return np.full(values.shape[0], np.nan) if block is None else block.sum(axis=1)
+
+
+# EMA như pandas ewm(adjust=False) (cách ta tính EMA, MACD, RSI) cho nhiều chuỗi cùng lúc:
+# một vòng theo trục ngày, mỗi bước là vài phép tính mảng trên tất cả các mã và tất cả các hệ số alpha
+def ewm_last(values, alpha, min_periods, history=False):
+    """
+    values: mảng (..., số ngày); alpha, min_periods: số hoặc mảng broadcast được với values[..., 0].
+    Trả về EMA ở ngày cuối (history=True: cả chuỗi); NaN khi chưa đủ min_periods quan sát.
+    Ngày thiếu số liệu được bỏ qua nhưng trọng số cũ vẫn giảm dần (ignore_na=False).
+    """
+    alpha = np.asarray(alpha, dtype=float)
+    # Đưa trục ngày lên đầu để mỗi bước đọc một khối liên tục trong bộ nhớ
+    values = np.ascontiguousarray(np.moveaxis(values, -1, 0))
+    observed = ~np.isnan(values)
+
+    # Trọng số cũ bằng 0 trước quan sát đầu tiên, nên quan sát đầu tiên trở thành giá trị EMA
+    shape = np.broadcast_shapes(values.shape[1:], alpha.shape)
+    weighted = np.zeros(shape)
+    old_weight = np.zeros(shape)
+    output = np.empty(values.shape[:1] + shape) if history else None
+
+    for i in range(len(values)):
+        old_weight *= 1 - alpha
+        blended = (old_weight * weighted + alpha * values[i]) / (old_weight + alpha)
+        weighted = np.where(observed[i], blended, weighted)
+        old_weight = np.where(observed[i], 1.0, old_weight)
+        if history:
+            output[i] = weighted
+
+    # Số quan sát tích lũy, thêm trục để broadcast với các hệ số alpha
+    counts = np.cumsum(observed, axis=0) if history else observed.sum(axis=0)[None]
+    counts = counts.reshape(counts.shape[:1] + (1,) * (len(shape) - observed.ndim + 1) + observed.shape[1:])
+    if history:
+        return np.moveaxis(np.where(counts >= min_periods, output, np.nan), 0, -1)
+    return np.where(counts[0] >= min_periods, weighted, np.nan)
+
+
+# Parabolic SAR theo đúng thuật toán của ta.trend.PSARIndicator, chạy một vòng theo ngày
+# và xử lý tất cả các mã cùng lúc; mỗi mã bắt đầu từ ngày đầu tiên có giá. Trả về giá trị ở ngày cuối.
+def psar_last(high, low, close, step=PSAR_STEP, max_step=PSAR_MAX_STEP):
+    rows, days = close.shape
+    index = np.arange(rows)
+    has_price = ~np.isnan(close)
+    first = np.where(has_price.any(axis=1), has_price.argmax(axis=1), days)
+
+    start = np.minimum(first, days - 1)
+    up_trend = np.ones(rows, dtype=bool)
+    factor = np.full(rows, step)
+    up_trend_high = high[index, start]
+    down_trend_low = low[index, start]
+
+    # Trục ngày lên đầu để mỗi bước đọc một khối liên tục trong bộ nhớ
+    high, low, close = (np.ascontiguousarray(values.T) for values in (high, low, close))
+    psar = close[min(1, days - 1)].copy()
+
+    for i in range(2, days):
+        # Mã chưa đủ 2 ngày có giá giữ nguyên trạng thái ban đầu và PSAR bằng giá đóng cửa
+        active = i >= first + 2
+        max_high, min_low = high[i], low[i]
+
+        # Điểm cực trị của xu hướng hiện tại: đỉnh khi tăng, đáy khi giảm
+        extreme = np.where(up_trend, up_trend_high, down_trend_low)
+        value = psar + factor * (extreme - psar)
+        reversal = active & np.where(up_trend, min_low < value, max_high > value)
+        extend = active & ~reversal & np.where(up_trend, max_high > up_trend_high, min_low < down_trend_low)
+
+        # Không đảo chiều: PSAR không được vượt qua đáy (xu hướng tăng) / đỉnh (xu hướng giảm) của 2 ngày trước
+        low1, low2 = low[i - 1], low[i - 2]
+        high1, high2 = high[i - 1], high[i - 2]
+        clamp_up = np.where(low2 < value, low2, np.where(low1 < value, low1, value))
+        clamp_down = np.where(high2 > value, high2, np.where(high1 > value, high1, value))
+        value = np.where(reversal, extreme, np.where(up_trend, clamp_up, clamp_down))
+        psar = np.where(active, value, close[i])
+
+        up_trend_high = np.where(np.where(up_trend, extend, reversal), max_high, up_trend_high)
+        down_trend_low = np.where(np.where(up_trend, reversal, extend), min_low, down_trend_low)
+        factor = np.where(reversal, step, np.where(extend, np.minimum(factor + step, max_step), factor))
+        up_trend = up_trend != reversal
+    return psar
+
+
+# Bảng chỉ báo của tất cả các mã tại ngày cuối cùng của ma trận
+def compute_snapshot(close, volume):
+    """
+    close, volume: ma trận (mã × ngày) tính đến ngày cần xem.
+    Trả về dict tên chỉ báo -> mảng giá trị theo mã, cùng tên cột với compute_timeseries_indicators.
+    """
+    close = np.asarray(close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    open_price, high, low = ohlc_from_close(close)
+
+    result = {
+        "open": open_price[:, -1], "close": close[:, -1], "high": high[:, -1], "low": low[:, -1],
+        "volume": volume[:, -1],
+    }
+
+    # SMA, EMA: các kỳ được tính chung trong một vòng (alpha = 2 / (kỳ + 1))
+    periods = np.array(MA_PERIODS)[:, None]
+    ema = ewm_last(close, 2 / (periods + 1), periods)
+    for k, period in enumerate(MA_PERIODS):
+        result[f"sma_{period}"] = _last_mean(close, period)
+        result[f"ema_{period}"] = ema[k]
+
+    # MACD: đường tín hiệu là EMA của cả chuỗi MACD
+    periods = np.array([MACD_FAST, MACD_SLOW])[:, None]
+    fast, slow = ewm_last(close, 2 / (periods + 1), periods, history=True)
+    macd = fast - slow
+    result["macd_line"] = macd[:, -1]
+    result["macd_signal"] = ewm_last(macd, 2 / (MACD_SIGNAL + 1), MACD_SIGNAL)
+    result["macd_histogram"] = result["macd_line"] - result["macd_signal"]
+
+    result["psar"] = psar_last(high, low, close)
+
+    # RSI: chênh lệch thiếu số liệu được tính là 0 như ta, nhưng chỉ từ ngày đầu tiên mã có giá.
+    # Chuỗi tăng/giảm của các kỳ được tính chung trong một vòng.
+    diff = np.diff(close, axis=1, prepend=np.nan)
+    started = np.maximum.accumulate(~np.isnan(close), axis=1)
+    up = np.where(started, np.where(diff > 0, diff, 0.0), np.nan)
+    down = np.where(started, np.where(diff < 0, -diff, 0.0), np.nan)
+    periods = np.array(RSI_PERIODS)[:, None]
+    average_up, average_down = ewm_last(np.stack([up, down])[:, None], 1 / periods, periods)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k, period in enumerate(RSI_PERIODS):
+            result[f"rsi_{period}"] = np.where(average_down[k] == 0, 100,
+                                               100 - 100 / (1 + average_up[k] / average_down[k]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for period in CCI_PERIODS:
+            result[f"cci_{period}"] = (close[:, -1] - _last_mean(close, period)) / (
+                    0.015 * _last_std(close, period, ddof=1))
+
+        result["bb_middle"] = _last_mean(close, BOLLINGER_WINDOW)
+        band = BOLLINGER_DEV * _last_std(close, BOLLINGER_WINDOW, ddof=0)
+        result["bb_upper"] = result["bb_middle"] + band
+        result["bb_lower"] = result["bb_middle"] - band
+
+        result["obv"] = np.nansum(np.sign(np.diff(close, axis=1)) * volume[:, 1:], axis=1)
+
+        typical_price = (high + low + close) / 3
+        raw_money_flow = typical_price * volume
+        result["typical_price"] = typical_price[:, -1]
+        result["raw_money_flow"] = raw_money_flow[:, -1]
+        result["money_flow_ratio"] = _last_sum(raw_money_flow, MFI_WINDOW) / _last_sum(
+            raw_money_flow, MFI_WINDOW, raw_money_flow.shape[1] - 1)
+        result["mfi"] = 100 - (100 / (1 + result["money_flow_ratio"]))
+    return result
+
+
+# Bảng chỉ báo (snapshot) của toàn thị trường tại một ngày, mỗi dòng một mã có giá và khối lượng ngày đó.
+# Kết quả được giữ trong kho giá (store["snapshots"]) cho SNAPSHOT_CACHE_SIZE ngày được xem gần nhất.
+# Kho giá dùng chung cho mọi phiên Streamlit (luồng), nên việc đọc/ghi bộ nhớ này được khóa
+# (store["snapshot_lock"]); phần tính toán chạy ngoài khóa để các phiên không phải chờ nhau.
+def universe_snapshot(store, date):
+    lock = store.setdefault("snapshot_lock", threading.Lock())
+    date = pd.Timestamp(date)
+    with lock:
+        snapshots = store.setdefault("snapshots", OrderedDict())
+        if date in snapshots:
+            snapshots.move_to_end(date)
+            return snapshots[date]
+
+    end = store["dates"].get_loc(date) + 1
+    price, volume = store["price"], store["volume"]
+    # Chỉ tính cho các mã có giá và khối lượng trong ngày (các mã khác không có trong bảng)
+    rows = np.flatnonzero(~np.isnan(price[:, end - 1]) & ~np.isnan(volume[:, end - 1]))
+    values = compute_snapshot(price[rows, :end], volume[rows, :end])
+    snapshot = pd.DataFrame({"Code": store["meta"]["Code"].to_numpy()[rows], **values})
+
+    with lock:
+        snapshots[date] = snapshot
+        snapshots.move_to_end(date)
+        while len(snapshots) > SNAPSHOT_CACHE_SIZE:
+            snapshots.popitem(last=False)
+    return snapshot
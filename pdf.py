@@ -1,47 +1,55 @@
 import os
 import datetime as dt
-from fpdf import FPDF
-from dotenv import load_dotenv
-import requests
 from datetime import datetime
-import tempfile
-import plotly.express as px
-import matplotlib.pyplot as plt
-import pandas as pd
-from readdata import *
-from caculate import calculate_financial_ratios
+from caculate import PERCENT_RATIOS
+from benchmark import get_peer_standing
 from drawchart import draw_chart
+from report import build_report_context
+from commentary import generate_commentary, stream_commentary, generate_commentary_batch, compact_table
 from pdf_instance import get_pdf_instance
 
-# Hàm tạo PDF
-def generate_pdf(stock_code, pdf = None):
-    # Lấy dữ liệu tài chính
-    transposed_df = process_financial_data(stock_code)
-    if transposed_df.empty:
-        print(f"Không tìm thấy dữ liệu cho mã cổ phiếu {stock_code}")
-        return
-    
-    return_pdf = False if pdf is None else True
-
-    # Tính các chỉ số tài chính
-    financial_ratios = calculate_financial_ratios(transposed_df)
-
-    # Thông tin công ty
-    today = dt.date.today()
-    company_name = transposed_df.iloc[1]['2024']
-    stock_symbol = transposed_df.iloc[0]['2024']
-    exchange_code = transposed_df.iloc[2]['2024']
-    industry = " - ".join(map(str, transposed_df.iloc[3:7]['2024'].values))
-
-    # Dữ liệu thông tin chung
-    general_info = [
-        ("Tên công ty", company_name),
-        ("Mã chứng khoán", stock_symbol),
-        ("Sàn giao dịch", exchange_code),
-        ("Ngành (ICB)", industry)
-    ]
-
-    # Dữ liệu bảng tài chính
+# Nội dung prompt nhận xét tài chính
+PROMPT_TEMPLATE = """Bạn là một chuyên gia phân tích tài chính chuyên về phân tích cơ bản cổ phiếu. Hãy đánh giá rủi ro và triển vọng đầu tư của mã cổ phiếu dựa trên các chỉ số tài chính và thông tin sau.
+Giữ văn phong chuyên nghiệp và báo cáo dưới 300 từ.
+
+Cho các dữ liệu báo cáo tài chính sau của {stock_symbol} (mỗi bảng: dòng đầu là các năm, các cột cách nhau bởi |, số liệu theo tỷ VND, chỉ số có "%" tính theo %):
+Bảng cân đối kế toán (Balance Sheet):
+{balance_sheet}
+Báo cáo thu nhập (Income Statement):
+{income_statement}
+Phân tích khả năng sinh lời (Profitability Analysis):
+{profitability_analysis}
+So sánh với doanh nghiệp cùng ngành (value: giá trị của công ty, q1/median/q3: tứ phân vị của ngành, percentile: thứ hạng phần trăm trong ngành):
+{industry_comparison}
+Hãy lấy các chỉ số tài chính từ các dữ liệu trên và đánh giá rủi ro và triển vọng đầu tư của mã cổ phiếu. kkhi đưa ra so sánh hoặc đánh giá nên trích dẫn số liệu cụ thể.
+Nhận xét với văn phong và từ ngữ nên được tham khảo sau đây, khi đưa ra so sánh hoặc đánh giá nên trích dẫn số liệu cụ thể lấy từ dữ liệu đã chocho:
+Yêu cầu phân tích:
+
+- PHÂN TÍCH TÀI CHÍNH:
+Một đoạn văn dưới 200 từ, phân tích các chỉ số tài chính quan trọng sau:
+Doanh thu và Lợi nhuận ròng: Xu hướng tăng trưởng qua các năm.
+Biên lợi nhuận gộp (Gross Margin), biên lợi nhuận ròng (Net Profit Margin): So sánh với trung bình ngành.
+Tỷ lệ giá trên thu nhập (P/E): Tỷ lệ này đo lường mối quan hệ giữa giá cổ phiếu và thu nhập của công ty. P/E càng cao thì cổ phiếu càng được định giá cao.
+Tỷ lệ giá trên giá trị sổ sách (P/B): Tỷ lệ này đo lường mối quan hệ giữa giá cổ phiếu và giá trị sổ sách của công ty. P/B càng thấp thì cổ phiếu càng được định giá thấp.
+Tỷ lệ lợi nhuận trên vốn chủ sở hữu (ROE): Tỷ lệ này đo lường khả năng sinh lời của công ty trên vốn chủ sở hữu. ROE càng cao thì công ty càng có khả năng tạo ra lợi nhuận.
+Tỷ lệ lợi nhuận trên tài sản (ROA): Tỷ lệ này đo lường khả năng sinh lời của công ty trên tổng tài sản. ROA càng cao thì công ty càng có khả năng tạo ra lợi nhuận từ tài sản của mình.
+Tỷ lệ nợ trên vốn chủ sở hữu (D/E): Tỷ lệ này đo lường mức độ đòn bẩy tài chính của công ty. D/E càng cao thì công ty càng phụ thuộc vào nợ vay.
+EBITDA: EBITDA là chỉ số đo lường lợi nhuận trước thuế, lãi vay, khấu hao và chi phí khấu hao.
+Hãy đưa ra nhận xét ngắn gọn về tình hình tài chính.
+
+- PHÂN TÍCH RỦI RO:
+Đoạn văn dưới 200 từ đánh giá được rủi ro tài chính (nợ vay, thanh khoản, dòng tiền).
+
+- ĐÁNH GIÁ TRIỂN VỌNG ĐẦU TƯ:
+Đoạn văn ngắn đánh giá ttiềm năng tăng trưởng lợi nhuận và biên lợi nhuận.
+
+Định dạng đầu ra mong muốn: Đoạn văn nhận xét súc tích, logic (khoảng bé hơnhơn 300 từ)
+Có kết luận rõ ràng về tiềm năng đầu tư của {stock_symbol}.
+"""
+
+
+# Các bảng số liệu của báo cáo: bảng cân đối, chỉ tiêu cơ bản, kết quả kinh doanh, khả năng sinh lời
+def report_tables(financial_ratios):
     balance_sheet_data = {
         "Total Current Assets": financial_ratios["Total Current Assets"],
         "Property/Plant/Equipment": financial_ratios["Property/Plant/Equipment"],
@@ -72,6 +80,82 @@ def generate_pdf(stock_code, pdf = None):
         "Total Debt/Equity, %": financial_ratios["Total Debt/Equity"],
         "ROS, %": financial_ratios["ROS"]
     }
+    return balance_sheet_data, fundamental_data, income_statement_data, profitability_analysis_data
+
+
+# Thông tin nhận diện công ty (mã, tên, sàn, 4 cấp ngành ICB) lấy theo năm gần nhất có báo cáo:
+# mã đã ngừng niêm yết không có số liệu ở các năm cuối trục năm (NaN)
+def company_info(transposed_df):
+    return transposed_df.iloc[:7].set_index("Chỉ tiêu").ffill(axis=1).iloc[:, -1]
+
+
+# Tạo prompt nhận xét cho một mã từ context báo cáo; các bảng số liệu được viết gọn (compact_table)
+# để giảm số token so với in dict của các Series đã định dạng chuỗi
+def build_commentary_prompt(context):
+    transposed_df = context["transposed_df"]
+    stock_symbol = context["stock_code"]
+    years = list(transposed_df.columns[1:])
+    balance_sheet_data, _, income_statement_data, profitability_analysis_data = report_tables(context["financial_ratios"])
+
+    # So sánh với doanh nghiệp cùng ngành (bảng chuẩn ngành được tính sẵn cho toàn thị trường)
+    industry_comparison = "Không có dữ liệu ngành"
+    try:
+        standing = get_peer_standing(stock_symbol)
+        if not standing.empty:
+            standing = standing[standing.index.isin(PERCENT_RATIOS)].drop(columns="count")
+            rows = {name: row.to_numpy() for name, row in standing.iterrows()}
+            industry_comparison = (f"Ngành {standing.attrs['industry']}, năm {standing.attrs['year']}:\n"
+                                   f"{compact_table(rows, standing.columns)}")
+    except Exception as e:
+        print(f"⚠️ Không thể tính chuẩn ngành: {e}")
+
+    return PROMPT_TEMPLATE.format(
+        stock_symbol=stock_symbol,
+        balance_sheet=compact_table(balance_sheet_data, years),
+        income_statement=compact_table(income_statement_data, years),
+        profitability_analysis=compact_table(profitability_analysis_data, years),
+        industry_comparison=industry_comparison,
+    )
+
+
+# Nội dung thay thế khi không tạo được nhận xét AI
+COMMENTARY_FALLBACK = "Không thể tạo nhận xét từ AI."
+
+
+# Hàm tạo PDF; context là kết quả của report.build_report_context (dữ liệu, chỉ số, biểu đồ dùng chung),
+# không truyền thì lấy mới. on_commentary(text): nếu có, nhận xét AI được tạo theo luồng và hàm này
+# được gọi với toàn bộ văn bản đã nhận mỗi khi có thêm token (ví dụ để hiển thị dần trên Streamlit).
+# commentary: nhận xét đã tạo sẵn (ví dụ từ generate_commentary_batch), khi có thì không gọi model.
+def generate_pdf(stock_code, pdf = None, context = None, on_commentary = None, commentary = None):
+    # Lấy dữ liệu tài chính và các chỉ số tài chính
+    if context is None:
+        context = build_report_context(stock_code)
+    if context is None:
+        print(f"Không tìm thấy dữ liệu cho mã cổ phiếu {stock_code}")
+        return
+    transposed_df = context["transposed_df"]
+    financial_ratios = context["financial_ratios"]
+
+    return_pdf = False if pdf is None else True
+
+    # Thông tin công ty (lấy theo năm gần nhất có báo cáo)
+    today = dt.date.today()
+    info = company_info(transposed_df)
+    company_name = info.iloc[1]
+    stock_symbol = context["stock_code"]
+    exchange_code = info.iloc[2]
+    industry = " - ".join(map(str, info.iloc[3:7].values))
+
+    # Dữ liệu thông tin chung
+    general_info = [
+        ("Tên công ty", company_name),
+        ("Mã chứng khoán", stock_symbol),
+        ("Sàn giao dịch", exchange_code),
+        ("Ngành (ICB)", industry)
+    ]
+
+    # Dữ liệu bảng tài chính
+    balance_sheet_data, fundamental_data, income_statement_data, profitability_analysis_data = report_tables(financial_ratios)
 
     # Danh sách năm
     years = list(transposed_df.columns[1:])
@@ -84,101 +168,23 @@ def generate_pdf(stock_code, pdf = None):
     pdf.create_table("FUNDAMENTAL", fundamental_data, years, header_color=(0, 128, 0))
     pdf.create_table("INCOME STATEMENT", income_statement_data, years, header_color=(76, 0, 153))
     pdf.create_table("PROFITABILITY ANALYSIS", profitability_analysis_data, years, header_color=(0, 102, 204))
-    import os
-    import google.generativeai as genai
-    import requests
-    from dotenv import load_dotenv
-
-    # Tải API key từ file môi trường
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-
-    # Kiểm tra xem API key có tồn tại không
-    if not api_key:
-        raise ValueError("API Key chưa được đặt. Vui lòng kiểm tra file .env")
-
-    # Cấu hình model Google Gemini
-    genai.configure(api_key=api_key)
-
-    generation_config = {
-        "temperature": 0,
-        "top_p": 0.95,
-        "top_k": 64,
-        "max_output_tokens": 8192,
-        "response_mime_type": "text/plain",
-    }
-
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    ]
-
-    model = genai.GenerativeModel(
-        model_name="gemini-2.0-flash-exp",
-        safety_settings=safety_settings,
-        generation_config=generation_config,
-        system_instruction="Chatbot này sẽ hoạt động như một broker chứng khoán chuyên nghiệp..."
-    )
-
-    # Kiểm tra nếu các biến dữ liệu chưa được khai báo
-    balance_sheet = balance_sheet_data
-    income_statement = income_statement_data
-    profitability_analysis = profitability_analysis_data
-
     # Thêm thông tin chung và bảng BALANCE SHEET trên cùng một trang
     pdf.chapter_title("THÔNG TIN CHUNG")
     pdf.set_font("DejaVu", size=12)
     pdf.set_left_margin(10)
     pdf.set_right_margin(10)
-    # Tạo nội dung prompt
-    prompt = f""" 
-    Bạn là một chuyên gia phân tích tài chính chuyên về phân tích cơ bản cổ phiếu. Hãy đánh giá rủi ro và triển vọng đầu tư của mã cổ phiếu dựa trên các chỉ số tài chính và thông tin sau.
-    Giữ văn phong chuyên nghiệp và báo cáo dưới 300 từ.
-
-    Cho các dữ liệu báo cáo tài chính sau:  
-    Bảng cân đối kế toán (Balance Sheet):
-    {balance_sheet}  
-    Báo cáo thu nhập (Income Statement):
-    {income_statement}  
-    Phân tích khả năng sinh lời (Profitability Analysis):
-    {profitability_analysis} 
-    Hãy lấy các chỉ số tài chính từ các dữ liệu trên và đánh giá rủi ro và triển vọng đầu tư của mã cổ phiếu. kkhi đưa ra so sánh hoặc đánh giá nên trích dẫn số liệu cụ thể.
-    Nhận xét với văn phong và từ ngữ nên được tham khảo sau đây, khi đưa ra so sánh hoặc đánh giá nên trích dẫn số liệu cụ thể lấy từ dữ liệu đã chocho:
-    Yêu cầu phân tích:
-
-    - PHÂN TÍCH TÀI CHÍNH:
-    Một đoạn văn dưới 200 từ, phân tích các chỉ số tài chính quan trọng sau:
-    Doanh thu và Lợi nhuận ròng: Xu hướng tăng trưởng qua các năm.
-    Biên lợi nhuận gộp (Gross Margin), biên lợi nhuận ròng (Net Profit Margin): So sánh với trung bình ngành.
-    Tỷ lệ giá trên thu nhập (P/E): Tỷ lệ này đo lường mối quan hệ giữa giá cổ phiếu và thu nhập của công ty. P/E càng cao thì cổ phiếu càng được định giá cao.
-    Tỷ lệ giá trên giá trị sổ sách (P/B): Tỷ lệ này đo lường mối quan hệ giữa giá cổ phiếu và giá trị sổ sách của công ty. P/B càng thấp thì cổ phiếu càng được định giá thấp.
-    Tỷ lệ lợi nhuận trên vốn chủ sở hữu (ROE): Tỷ lệ này đo lường khả năng sinh lời của công ty trên vốn chủ sở hữu. ROE càng cao thì công ty càng có khả năng tạo ra lợi nhuận.
-    Tỷ lệ lợi nhuận trên tài sản (ROA): Tỷ lệ này đo lường khả năng sinh lời của công ty trên tổng tài sản. ROA càng cao thì công ty càng có khả năng tạo ra lợi nhuận từ tài sản của mình.
-    Tỷ lệ nợ trên vốn chủ sở hữu (D/E): Tỷ lệ này đo lường mức độ đòn bẩy tài chính của công ty. D/E càng cao thì công ty càng phụ thuộc vào nợ vay.
-    EBITDA: EBITDA là chỉ số đo lường lợi nhuận trước thuế, lãi vay, khấu hao và chi phí khấu hao.
-    Hãy đưa ra nhận xét ngắn gọn về tình hình tài chính.
-
-    - PHÂN TÍCH RỦI RO:
-    Đoạn văn dưới 200 từ đánh giá được rủi ro tài chính (nợ vay, thanh khoản, dòng tiền).
-
-    - ĐÁNH GIÁ TRIỂN VỌNG ĐẦU TƯ:
-    Đoạn văn ngắn đánh giá ttiềm năng tăng trưởng lợi nhuận và biên lợi nhuận.
-
-    Định dạng đầu ra mong muốn: Đoạn văn nhận xét súc tích, logic (khoảng bé hơnhơn 300 từ)
-    Có kết luận rõ ràng về tiềm năng đầu tư của HPG.
-    """
-
-    headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-
+    # Nhận xét từ AI (lấy từ bộ nhớ đệm nếu prompt không đổi)
+    formatted_comment = COMMENTARY_FALLBACK
     try:
-        response = model.generate_content(prompt)
-        result = response.text
+        if commentary is not None:
+            result = commentary
+        elif on_commentary is None:
+            result = generate_commentary(build_commentary_prompt(context))
+        else:
+            result = ""
+            for chunk in stream_commentary(build_commentary_prompt(context)):
+                result += chunk
+                on_commentary(result)
         formatted_comment = result.replace("*", "")
         print("API Response:", formatted_comment)  # Kiểm tra phản hồi từ API
     except Exception as e:
@@ -219,13 +225,16 @@ def generate_pdf(stock_code, pdf = None):
     # Thêm 4 biểu đồ vào PDF
     pdf.add_page()
     pdf.chapter_title("BIỂU ĐỒ.")
-    pdf.image(f"images/output/revenue_totalassets_equity_{stock_code}.png", x=45, y=35, w=120, h=100)
-    pdf.image(f"images/output/asset_structure_{stock_code}.png", x=45, y=145, w=120, h=100)
+    if context["charts"] is None:
+        context["charts"] = draw_chart(stock_code, context=context)
+    charts = context["charts"]
+    pdf.image(charts["revenue_totalassets_equity"], x=45, y=35, w=120, h=100)
+    pdf.image(charts["asset_structure"], x=45, y=145, w=120, h=100)
 
     pdf.add_page()
     pdf.chapter_title("BIỂU ĐỒ")
-    pdf.image(f"images/output/equity_roe_roa_{stock_code}.png", x=45, y=35, w=120, h=100)
-    pdf.image(f"images/output/income_after_tax_margin_{stock_code}.png", x=45, y=145, w=120, h=100)
+    pdf.image(charts["equity_roe_roa"], x=45, y=35, w=120, h=100)
+    pdf.image(charts["income_after_tax_margin"], x=45, y=145, w=120, h=100)
 
    # Trang cuối: Nhận xét từ AI
     pdf.add_page()
@@ -245,3 +254,29 @@ def generate_pdf(stock_code, pdf = None):
         os.startfile(pdf_filename)
     else:
         return pdf
+
+
+# Tạo báo cáo PDF cho danh sách mã theo dõi: nhận xét AI của tất cả các mã được gọi đồng thời
+# (giới hạn số luồng và tốc độ, tự thử lại khi lỗi), sau đó kết quả được truyền thẳng cho từng PDF.
+# batch_options được truyền cho commentary.generate_commentary_batch. Trả về dict: mã -> file PDF.
+def generate_watchlist_reports(tickers, output_dir=".", **batch_options):
+    contexts = {}
+    for ticker in dict.fromkeys(str(ticker).strip().upper() for ticker in tickers):
+        context = build_report_context(ticker)
+        if context is None:
+            print(f"Không tìm thấy dữ liệu cho mã cổ phiếu {ticker}")
+            continue
+        contexts[ticker] = context
+
+    commentaries = generate_commentary_batch(
+        {ticker: build_commentary_prompt(context) for ticker, context in contexts.items()}, **batch_options)
+
+    os.makedirs(output_dir, exist_ok=True)
+    files = {}
+    for ticker, context in contexts.items():
+        # Mã vẫn lỗi sau khi thử lại dùng nội dung thay thế, không gọi model lần nữa ngoài bộ giới hạn tốc độ
+        pdf = generate_pdf(ticker, get_pdf_instance(), context,
+                           commentary=commentaries.get(ticker) or COMMENTARY_FALLBACK)
+        files[ticker] = os.path.join(output_dir, f"{ticker}_FINANCIAL_REPORT.pdf")
+        pdf.output(files[ticker])
+    return files
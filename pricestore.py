@@ -0,0 +1,139 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from filecache import source_signature, read_meta, write_meta, temp_path
+
+# File Excel giá và khối lượng giao dịch: mỗi dòng một mã, mỗi ngày giao dịch một cột
+PRICE_SOURCE = os.path.join("Data", "Processed_Vietnam_Price.xlsx")
+VOLUME_SOURCE = os.path.join("Data", "Processed_Vietnam_volume_2.xlsx")
+
+# Kho dữ liệu dạng cột: ma trận float32 (mã × ngày) của giá và khối lượng, trục ngày và từng cột
+# thông tin mã được lưu thành các mảng riêng trong một file .npz (không nén, không dùng pickle)
+PRICE_STORE_PATH = os.path.join("Data", "cache", "price_volume.npz")
+PRICE_STORE_META = os.path.join("Data", "cache", "price_volume.json")
+
+# Các cột thông tin mã được giữ lại trong kho
+META_COLUMNS = ["Code", "Name", "RIC", "Exchange", "Sector"]
+
+# Kho đã đọc trong tiến trình, đọc lại khi file nguồn thay đổi
+_price_store = {}
+
+
+# Đọc một file Excel dạng bảng rộng, trả về (thông tin mã, trục ngày, ma trận số liệu float32).
+# Cột ngày là các cột có tiêu đề đọc được thành ngày; các cột khác (Start Date, Activity, % Change) bị bỏ qua.
+def read_wide_sheet(path):
+    df = pd.read_excel(path)
+    df = df.dropna(subset=["Code"])
+    df["Code"] = df["Code"].astype(str).str.strip()
+    # Mã bị lặp (do ghép thông tin theo tên công ty) chỉ giữ dòng đầu tiên
+    df = df.drop_duplicates("Code").reset_index(drop=True)
+
+    headers = pd.to_datetime(pd.Series([str(col) for col in df.columns]), format="mixed", errors="coerce")
+    headers[df.columns.isin(META_COLUMNS)] = pd.NaT
+    date_positions = np.flatnonzero(headers.notna().to_numpy())
+    order = date_positions[np.argsort(headers.iloc[date_positions].to_numpy(), kind="stable")]
+
+    dates = pd.DatetimeIndex(headers.iloc[order]).normalize()
+    values = df.iloc[:, order].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float32)
+    meta = df.reindex(columns=META_COLUMNS)
+    return meta, dates, values
+
+
+# Chuyển hai file Excel giá và khối lượng sang kho dạng cột.
+# Khối lượng được sắp theo đúng trục mã và trục ngày của bảng giá (thiếu số liệu thì là NaN).
+def convert_price_volume(price_path=PRICE_SOURCE, volume_path=VOLUME_SOURCE,
+                         store_path=PRICE_STORE_PATH, meta_path=PRICE_STORE_META):
+    meta, dates, price = read_wide_sheet(price_path)
+    volume_meta, volume_dates, volume_values = read_wide_sheet(volume_path)
+
+    rows = pd.Index(volume_meta["Code"]).get_indexer(meta["Code"])
+    columns = volume_dates.get_indexer(dates)
+    volume = np.full(price.shape, np.nan, dtype=np.float32)
+    volume[np.ix_(rows >= 0, columns >= 0)] = volume_values[np.ix_(rows[rows >= 0], columns[columns >= 0])]
+
+    arrays = {"price": price, "volume": volume, "dates": dates.to_numpy(dtype="datetime64[D]")}
+    for column in META_COLUMNS:
+        arrays[f"meta_{column}"] = meta[column].fillna("").astype(str).to_numpy(dtype=str)
+
+    store_dir = os.path.dirname(store_path)
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+    # Tên file tạm riêng cho mỗi lần ghi: các phiên Streamlit (luồng) có thể cùng chuyển đổi lại kho
+    temp_name = temp_path(store_path)
+    with open(temp_name, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temp_name, store_path)
+
+    write_meta(meta_path, {"sources": source_signature([price_path, volume_path]),
+                           "tickers": int(price.shape[0]), "dates": int(price.shape[1])})
+    print(f"✅ Đã tạo kho giá & khối lượng: {price.shape[0]} mã × {price.shape[1]} ngày")
+
+
+def _read_store(store_path):
+    with np.load(store_path, allow_pickle=False) as data:
+        meta = pd.DataFrame({column: data[f"meta_{column}"] for column in META_COLUMNS})
+        dates = pd.DatetimeIndex(data["dates"].astype("datetime64[ns]"))
+        return {
+            "meta": meta.replace("", np.nan),
+            "dates": dates,
+            # Trục ngày dạng số (nano giây) để tìm khoảng ngày bằng searchsorted
+            "date_values": dates.asi8,
+            # Chỉ mục mã -> vị trí dòng trong ma trận
+            "code_index": {code: row for row, code in enumerate(meta["Code"])},
+            "price": data["price"],
+            "volume": data["volume"],
+        }
+
+
+# Lấy kho giá & khối lượng; chỉ chuyển đổi lại từ Excel khi file nguồn thay đổi.
+# Nếu không có file Excel (ví dụ máy chủ chỉ được triển khai kèm kho đã chuyển đổi) thì dùng kho hiện có.
+def load_price_volume(price_path=PRICE_SOURCE, volume_path=VOLUME_SOURCE,
+                      store_path=PRICE_STORE_PATH, meta_path=PRICE_STORE_META):
+    """
+    Trả về dict gồm:
+      - "meta": DataFrame các cột META_COLUMNS, mỗi dòng một mã
+      - "dates": DatetimeIndex các ngày giao dịch (tăng dần), "date_values": trục ngày dạng int64
+      - "code_index": dict mã -> vị trí dòng
+      - "price", "volume": ma trận float32 kích thước (số mã × số ngày)
+    """
+    # Phiên bản của hai file nguồn; None nếu thiếu file Excel
+    signature = source_signature([price_path, volume_path])
+    cached = _price_store.get(store_path)
+    if cached is not None and cached["signature"] == signature:
+        return cached
+
+    # Phiên bản đã chuyển đổi được lưu trong file JSON dạng danh sách, đổi về tuple để so sánh
+    stored = tuple(tuple(entry) for entry in (read_meta(meta_path) or {}).get("sources") or ())
+    if signature is not None and (stored != signature or not os.path.exists(store_path)):
+        convert_price_volume(price_path, volume_path, store_path, meta_path)
+    elif not os.path.exists(store_path):
+        raise FileNotFoundError(f"Không tìm thấy dữ liệu giá & khối lượng: {price_path}, {volume_path}")
+
+    store = _read_store(store_path)
+    store["signature"] = signature
+    _price_store[store_path] = store
+    return store
+
+
+# Vị trí [đầu, cuối) của các ngày trong khoảng [start, end] trên trục ngày
+def date_range_slice(store, start, end):
+    date_values = store["date_values"]
+    lo = np.searchsorted(date_values, pd.Timestamp(start).value, side="left")
+    hi = np.searchsorted(date_values, pd.Timestamp(end).value, side="right")
+    return slice(lo, hi)
+
+
+# Chuỗi (ngày, giá, khối lượng) của một mã trong khoảng [start, end]: một lát cắt trên dòng của mã.
+# Trả về None nếu không có mã.
+def series_slice(store, code, start, end):
+    row = store["code_index"].get(code)
+    if row is None:
+        return None
+    dates = date_range_slice(store, start, end)
+    return store["dates"][dates], store["price"][row, dates], store["volume"][row, dates]
+
+
+if __name__ == "__main__":
+    # python pricestore.py [file giá] [file khối lượng]
+    convert_price_volume(*sys.argv[1:3])
@@ -0,0 +1,58 @@
+import ast
+import sys
+import time
+import argparse
+import subprocess
+
+# Đo thời gian khởi động của ứng dụng: chạy các lệnh import cấp module của WEB.py trong một tiến trình mới
+# với "python -X importtime" và liệt kê các thư viện tốn thời gian nhất.
+# Dùng --budget để báo lỗi (mã thoát 1) khi thời gian import vượt ngưỡng, tránh thêm lại import nặng.
+APP_FILE = "WEB.py"
+
+
+# Các lệnh import ở cấp module (không tính import bên trong hàm hoặc nhánh của từng tab)
+def top_level_imports(path=APP_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    return [ast.get_source_segment(source, node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+# Chạy các lệnh import, trả về (thời gian thực, danh sách (thời gian tích lũy, tên module) ở cấp ngoài cùng)
+def profile_imports(statements):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "\n".join(statements)],
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Module được import trực tiếp có đúng một dấu cách trước tên, module con thụt lề thêm
+        if not name.startswith("  "):
+            modules.append((int(cumulative) / 1e6, name.strip()))
+    return elapsed, sorted(modules, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian import lúc khởi động của WEB.py")
+    parser.add_argument("--top", type=int, default=15, help="số module tốn thời gian nhất được in ra")
+    parser.add_argument("--budget", type=float, default=None, help="ngưỡng thời gian import tối đa (giây)")
+    args = parser.parse_args()
+
+    elapsed, modules = profile_imports(top_level_imports())
+    for seconds, name in modules[:args.top]:
+        print(f"{seconds:8.3f}s  {name}")
+    print(f"Tổng thời gian import (gồm khởi động Python): {elapsed:.2f} giây")
+
+    if args.budget is not None and elapsed > args.budget:
+        print(f"❌ Vượt ngưỡng {args.budget:.2f} giây")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
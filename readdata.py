@@ -1,40 +1,37 @@
-import plotly.express as px
-import os
-import datetime as dt
-import streamlit as st
-from fpdf import FPDF
-from dotenv import load_dotenv
-import requests
-import tempfile
 import pandas as pd
-from matplotlib.backends.backend_pdf import PdfPages
-from caculate import calculate_financial_ratios
-from drawchart import draw_chart
-import matplotlib.pyplot as plt
-
-# Chuyển đổi đơn vị
-def convert_units(df, factor, start_col):
-    try:
-        start_idx = df.columns.get_loc(start_col) + 1
-        numeric_cols = df.columns[start_idx:]
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce') / factor
-    except Exception as e:
-        print(f"⚠️ Lỗi khi chuyển đổi đơn vị: {e}")
-    return df
-
-# Chuẩn hóa tên cột
-def standardize_columns(df):
-    df = df.copy()
-    df.columns = df.columns.str.strip().str.replace("\n", " ").str.upper()
-    return df
+from datastore import standardize_columns, get_fundamentals, get_name_index, discover_years, START_COLUMN
+from search_index import match_companies
 
 # Gộp dữ liệu theo mã hoặc tên công ty
-def merge_balance_sheets(dfs, search_term):
+def merge_balance_sheets(dfs, search_term, ticker_index=None, name_index=None, years=None):
     data = []
-    dfs = [standardize_columns(df) for df in dfs]
+    years = discover_years() if years is None else years
     search_term = search_term.upper().strip()
 
-    for year, df in zip(range(2020, 2025), dfs):
+    # Tra cứu qua chỉ mục dựng sẵn: lấy trực tiếp các dòng thay vì quét toàn bảng
+    # Mã dài hơn 3 ký tự (ví dụ chứng chỉ quỹ) có trong chỉ mục mã cũng được tìm theo mã
+    is_ticker = len(search_term) <= 3 or (ticker_index is not None and search_term in ticker_index)
+    if ticker_index is not None and (is_ticker or name_index is not None):
+        if is_ticker:
+            locations = ticker_index.get(search_term, [])
+        else:
+            # Tìm theo tên công ty, không phân biệt dấu (ví dụ "HOA PHAT" khớp "HÒA PHÁT")
+            tickers = match_companies(name_index, search_term)
+            locations = sorted(loc for ticker in tickers for loc in ticker_index.get(ticker, []))
+
+        dfs_by_year = dict(zip(years, dfs))
+        for year, pos in locations:
+            print(f"✅ Tìm thấy dữ liệu cho {search_term} năm {year}")
+            data.append(dfs_by_year[year].iloc[[pos]].set_axis([year]))
+
+        if data:
+            return pd.concat(data)
+        print(f"❌ Không tìm thấy dữ liệu cho '{search_term}'")
+        return pd.DataFrame()
+
+    dfs = [standardize_columns(df) for df in dfs]
+
+    for year, df in zip(years, dfs):
         if 'MÃ' not in df.columns or 'TÊN CÔNG TY' not in df.columns:
             print(f"❌ Thiếu cột 'MÃ' hoặc 'TÊN CÔNG TY' trong file năm {year}")
             continue
@@ -51,10 +48,10 @@ def merge_balance_sheets(dfs, search_term):
 
         if not stock_data.empty:
             print(f"✅ Tìm thấy dữ liệu cho {search_term} năm {year}")
-            data.append(stock_data)
+            data.append(stock_data.set_axis([year] * len(stock_data)))
 
     if data:
-        return pd.concat(data, ignore_index=True)
+        return pd.concat(data)
     else:
         print(f"❌ Không tìm thấy dữ liệu cho '{search_term}'")
         return pd.DataFrame()
@@ -63,56 +60,73 @@ def merge_balance_sheets(dfs, search_term):
 # Xử lý dữ liệu tài chính
 def process_financial_data(search_term):
     try:
-        # Đọc dữ liệu từ các file Excel
-        file_names = [f"{year}-Vietnam.xlsx" for year in range(2020, 2025)]
-        dfs = [pd.read_excel(file, engine="openpyxl") for file in file_names]
-
-        # Chuẩn hóa tên cột
-        for df, year in zip(dfs, range(2020, 2025)):
-            df.columns = df.columns.str.replace(f"Năm: {year}", "", regex=True).str.strip()
-            df.columns = df.columns.str.replace(r"Đơn vị: (Tỷ|Triệu) VND", "", regex=True).str.strip()
-            df.columns = df.columns.str.replace(r"\bHợp nhất\b", "", regex=True).str.strip()
-            df.columns = df.columns.str.replace(r"\bQuý: Hàng năm\b", "", regex=True).str.strip()
-
-        # Xóa các cột không cần thiết
-        for df in dfs:
-            df.drop(columns=[col for col in df.columns if "TM" in col], inplace=True, errors='ignore')
-
-        # Xác định tên cột tham chiếu
-        start_column = "Trạng thái kiểm toán"
-        start_column_cleaned = start_column.replace("Hợp nhất", "").replace("Hàng năm", "").strip()
-
-        # Chuyển đổi đơn vị (3 năm đầu)
-        for i in range(3):
-            dfs[i] = convert_units(dfs[i], 1e9, start_column_cleaned)
-
-        # Gộp dữ liệu
-        merged_df = merge_balance_sheets(dfs, search_term)
+        # Đọc dữ liệu đã làm sạch (từ bộ nhớ đệm nếu file Excel không thay đổi)
+        store = get_fundamentals()
+
+        # Gộp dữ liệu; chỉ mục tên công ty chỉ cần khi tìm theo tên
+        term = search_term.upper().strip()
+        name_index = get_name_index(store) if len(term) > 3 and term not in store["ticker_index"] else None
+        merged_df = merge_balance_sheets(store["dfs"], search_term, store["ticker_index"], name_index, store["years"])
         if merged_df.empty:
             return pd.DataFrame()
 
         # Xóa cột không mong muốn
         merged_df = merged_df.loc[:, ~merged_df.columns.str.contains("CURRENT RATIO", case=False, na=False)]
 
-        # Chuyển đổi DataFrame từ 5 hàng × N cột thành N hàng × 5 cột
-        transposed_df = merged_df.T
-        transposed_df.reset_index(inplace=True)
-
-        # Xử lý cột dư thừa
-        expected_years = [str(year) for year in range(2020, 2025)]
-        valid_columns = ["Chỉ tiêu"] + expected_years
+        # Mỗi dòng được gắn nhãn theo năm của nó; tìm theo tên khớp nhiều công ty thì chỉ giữ công ty đầu tiên
+        if "MÃ" in merged_df.columns:
+            merged_df = merged_df[merged_df["MÃ"] == merged_df["MÃ"].iloc[0]]
+        merged_df = merged_df[~merged_df.index.duplicated()]
 
-        if len(transposed_df.columns) != len(valid_columns):
-            print(f"⚠️ Phát hiện số cột không khớp. Đang điều chỉnh...")
-            transposed_df = transposed_df.iloc[:, :len(valid_columns)]
-
-        # Gán lại tên cột
-        transposed_df.columns = valid_columns
-        transposed_df.fillna(0, inplace=True)
+        # Chuyển đổi DataFrame từ (năm × chỉ tiêu) thành (chỉ tiêu × năm), đủ các năm của trục năm.
+        # Năm mã không có báo cáo được để trống (NaN), không bị điền 0.
+        transposed_df = merged_df.T.fillna(0).reindex(columns=list(store["years"]))
+        transposed_df.columns = [str(year) for year in store["years"]]
+        transposed_df = transposed_df.rename_axis("Chỉ tiêu").reset_index()
 
         print(f"✅ Dữ liệu sau khi điều chỉnh: {transposed_df.shape[1]} cột")
         return transposed_df
 
     except Exception as e:
         print(f"🛑 Lỗi trong quá trình xử lý dữ liệu: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+
+# Xử lý dữ liệu tài chính cho nhiều mã cùng lúc (tickers=None: toàn bộ thị trường)
+def process_financial_data_many(tickers=None):
+    """
+    Trả về bảng panel số: chỉ mục (MÃ, NĂM), mỗi cột là một chỉ tiêu tài chính.
+    Chỉ duyệt dữ liệu đã làm sạch một lần, không đọc lại Excel cho từng mã.
+    """
+    try:
+        store = get_fundamentals()
+        ticker_index = store["ticker_index"]
+
+        positions = None
+        if tickers is not None:
+            tickers = [str(ticker).strip().upper() for ticker in tickers]
+            missing = [ticker for ticker in tickers if ticker not in ticker_index]
+            if missing:
+                print(f"⚠️ Không tìm thấy dữ liệu cho: {', '.join(missing)}")
+
+            positions = {year: [] for year in store["years"]}
+            for ticker in dict.fromkeys(tickers):
+                for year, pos in ticker_index.get(ticker, []):
+                    positions[year].append(pos)
+
+        frames = []
+        for year, df in zip(store["years"], store["dfs"]):
+            start_idx = df.columns.get_loc(START_COLUMN.upper()) + 1
+            numeric_cols = [col for col in df.columns[start_idx:] if "CURRENT RATIO" not in col]
+
+            rows = df if positions is None else df.iloc[positions[year]]
+            frame = rows[["MÃ"] + numeric_cols].copy()
+            frame.insert(1, "NĂM", year)
+            frames.append(frame)
+
+        panel = pd.concat(frames, ignore_index=True).set_index(["MÃ", "NĂM"]).sort_index()
+        return panel.astype(float).fillna(0)
+
+    except Exception as e:
+        print(f"🛑 Lỗi trong quá trình xử lý dữ liệu: {e}")
+        return pd.DataFrame()
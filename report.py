@@ -0,0 +1,16 @@
+from readdata import process_financial_data
+from caculate import calculate_financial_ratios
+
+
+# Dữ liệu dùng chung cho mọi phần của báo cáo một mã cổ phiếu: dữ liệu tài chính và các chỉ số
+# chỉ được lấy và tính một lần, biểu đồ được vẽ một lần rồi truyền cho các bước tạo PDF
+def build_report_context(stock_code):
+    transposed_df = process_financial_data(stock_code)
+    if transposed_df.empty:
+        return None
+    return {
+        "stock_code": stock_code,
+        "transposed_df": transposed_df,
+        "financial_ratios": calculate_financial_ratios(transposed_df),
+        "charts": None,
+    }
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from datastore import get_fundamentals
+from readdata import process_financial_data_many
+from caculate import labels, evaluate_panel
+from formula import compile_formulas
+
+# Các đại lượng trung gian cho Piotroski F-score và Altman Z''-score.
+# Altman Z'' (bản cho doanh nghiệp phi sản xuất/thị trường mới nổi) dùng vốn chủ sở hữu sổ sách
+# thay cho vốn hóa thị trường, vì dữ liệu cơ bản không có giá cổ phiếu.
+score_formulas = [
+    "roa = net_income / total_assets",
+    "cfo_to_assets = operating_cash_flow / total_assets",
+    "leverage = long_term_borrowings / total_assets",
+    "current_ratio = current_assets / total_current_liabilities",
+    "gross_margin = gross_profit / revenue",
+    "asset_turnover = revenue / total_assets",
+    "working_capital_to_assets = (current_assets - total_current_liabilities) / total_assets",
+    "retained_earnings_to_assets = retained_earnings / total_assets",
+    "ebit_to_assets = (profit_before_tax - borrowing_cost) / total_assets",
+    "equity_to_liabilities = total_equity / total_liabilities",
+    "altman_z = 6.56 * working_capital_to_assets + 3.26 * retained_earnings_to_assets"
+    " + 6.72 * ebit_to_assets + 1.05 * equity_to_liabilities",
+]
+
+score_columns = {name: name for name in [
+    "total_assets", "operating_cash_flow", "equity_issued", "roa", "cfo_to_assets", "leverage",
+    "current_ratio", "gross_margin", "asset_turnover", "altman_z",
+]}
+
+SCORE_PLAN = compile_formulas(score_formulas, labels, score_columns)
+
+# Ngưỡng phân vùng của Altman Z''
+ALTMAN_SAFE = 2.6
+ALTMAN_DISTRESS = 1.1
+
+# Bảng điểm đã tính, dựng lại khi dữ liệu tài chính thay đổi
+_scores = {}
+
+
+# Giá trị năm trước trên trục năm (năm đầu tiên là NaN)
+def _previous(values):
+    previous = np.full(values.shape, np.nan)
+    previous[:, 1:] = values[:, :-1]
+    return previous
+
+
+# Tính F-score, Z-score và thay đổi so với năm trước cho toàn bộ công ty trong một lần tính mảng
+def compute_scores(panel):
+    """
+    panel: kết quả của readdata.process_financial_data_many, chỉ mục (MÃ, NĂM).
+    Trả về DataFrame chỉ mục (MÃ, NĂM) gồm 9 tiêu chí Piotroski, F-Score, Altman Z và mức thay đổi.
+    """
+    m, tickers, years = evaluate_panel(SCORE_PLAN, panel)
+
+    # Năm không có số liệu (tổng tài sản bằng 0) không được chấm điểm
+    has_data = m["total_assets"] != 0
+    has_previous = has_data & (np.nan_to_num(_previous(m["total_assets"])) != 0)
+
+    signals = {
+        "F1 ROA > 0": m["roa"] > 0,
+        "F2 CFO > 0": m["operating_cash_flow"] > 0,
+        "F3 ΔROA > 0": m["roa"] > _previous(m["roa"]),
+        "F4 CFO > LNST": m["cfo_to_assets"] > m["roa"],
+        "F5 ΔĐòn bẩy < 0": m["leverage"] < _previous(m["leverage"]),
+        "F6 ΔThanh khoản > 0": m["current_ratio"] > _previous(m["current_ratio"]),
+        "F7 Không phát hành CP": m["equity_issued"] <= 0,
+        "F8 ΔBiên LN gộp > 0": m["gross_margin"] > _previous(m["gross_margin"]),
+        "F9 ΔVòng quay TS > 0": m["asset_turnover"] > _previous(m["asset_turnover"]),
+    }
+
+    f_score = np.where(has_previous, sum(signal.astype(float) for signal in signals.values()), np.nan)
+    altman_z = np.where(has_data, m["altman_z"], np.nan)
+
+    result = {name: np.where(has_previous, signal, np.nan) for name, signal in signals.items()}
+    result["F-Score"] = f_score
+    result["Δ F-Score"] = f_score - _previous(f_score)
+    result["Altman Z"] = altman_z
+    result["Δ Altman Z"] = altman_z - _previous(altman_z)
+
+    index = pd.MultiIndex.from_product([tickers, years], names=panel.index.names)
+    scores = pd.DataFrame({name: value.reshape(-1) for name, value in result.items()}, index=index)
+    scores["Vùng Altman"] = pd.cut(scores["Altman Z"], [-np.inf, ALTMAN_DISTRESS, ALTMAN_SAFE, np.inf],
+                                   labels=["Nguy hiểm", "Cảnh báo", "An toàn"])
+    return scores
+
+
+# Lấy bảng điểm cho toàn thị trường, chỉ tính lại khi phiên bản dữ liệu thay đổi
+def get_scores():
+    signature = get_fundamentals()["signature"]
+    cached = _scores.get("current")
+    if cached is None or cached["signature"] != signature:
+        cached = {"signature": signature, "scores": compute_scores(process_financial_data_many())}
+        _scores["current"] = cached
+    return cached["scores"]
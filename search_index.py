@@ -0,0 +1,114 @@
+import re
+import unicodedata
+from collections import Counter
+
+
+# Bỏ dấu tiếng Việt và chuẩn hóa khoảng trắng, ví dụ "Hòa Phát" -> "HOA PHAT"
+def fold_accents(text):
+    text = str(text).replace("Đ", "D").replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.sub(r"\s+", " ", text).strip().upper()
+
+
+# Tập n-gram của chuỗi (mặc định trigram)
+def _ngrams(text, n=3):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+# Thêm một tên công ty (đã bỏ dấu) vào danh sách tên của mã
+def _add_name(names, ticker, name):
+    folded = fold_accents(name)
+    ticker_names = names.setdefault(ticker, [])
+    if folded not in ticker_names:
+        ticker_names.append(folded)
+
+
+# Dựng chỉ mục tên công ty (đã bỏ dấu) -> mã cổ phiếu trên tất cả các năm
+def build_name_index(dfs, years):
+    names = {}
+    display = {}
+    for year, df in zip(years, dfs):
+        if 'MÃ' not in df.columns or 'TÊN CÔNG TY' not in df.columns:
+            continue
+        for ticker, name in zip(df['MÃ'].to_numpy(), df['TÊN CÔNG TY'].to_numpy()):
+            _add_name(names, ticker, name)
+            display[ticker] = name
+    return _index_names(names, display)
+
+
+# Dựng chỉ mục từ dict mã -> tên công ty (ví dụ tên lấy từ dữ liệu của một tab).
+# base: chỉ mục có sẵn (ví dụ của dữ liệu tài chính) được gộp thêm, không phải đọc lại dữ liệu của nó.
+def build_name_index_from_names(display_names, base=None):
+    names = {ticker: list(ticker_names) for ticker, ticker_names in base["names"].items()} if base else {}
+    display = dict(base["display"]) if base else {}
+    for ticker, name in display_names.items():
+        _add_name(names, ticker, name)
+        display.setdefault(ticker, name)
+    return _index_names(names, display)
+
+
+# Chỉ mục trigram trên mã và các tên đã bỏ dấu
+def _index_names(names, display):
+    grams = {}
+    for ticker, ticker_names in names.items():
+        ticker_grams = _ngrams(fold_accents(ticker))
+        for folded in ticker_names:
+            ticker_grams |= _ngrams(f" {folded} ")
+        for gram in ticker_grams:
+            grams.setdefault(gram, set()).add(ticker)
+
+    return {"names": names, "display": display, "grams": grams}
+
+
+# Các mã có tên công ty chứa chuỗi tìm kiếm (không phân biệt dấu)
+def match_companies(name_index, query):
+    folded = fold_accents(query)
+    if not folded:
+        return []
+
+    query_grams = _ngrams(folded)
+    if query_grams:
+        postings = sorted((name_index["grams"].get(gram, set()) for gram in query_grams), key=len)
+        candidates = set.intersection(*postings)
+    else:
+        candidates = name_index["names"].keys()
+
+    names = name_index["names"]
+    return [ticker for ticker in candidates if any(folded in name for name in names[ticker])]
+
+
+# Tìm kiếm theo mã hoặc tên công ty, trả về danh sách mã đã xếp hạng
+def search_companies(name_index, query, limit=10):
+    folded = fold_accents(query)
+    if not folded:
+        return []
+
+    names = name_index["names"]
+    matches = set(match_companies(name_index, query))
+    if folded in names:
+        matches.add(folded)
+    matches |= {ticker for ticker in names if ticker.startswith(folded)}
+
+    if matches:
+        # Ưu tiên: trùng mã > mã bắt đầu bằng chuỗi > tên bắt đầu bằng chuỗi > tên chứa chuỗi
+        def rank(ticker):
+            if ticker == folded:
+                return (0, 0, ticker)
+            if ticker.startswith(folded):
+                return (1, len(ticker), ticker)
+            shortest = min(len(name) for name in names[ticker])
+            if any(name.startswith(folded) for name in names[ticker]):
+                return (2, shortest, ticker)
+            return (3, shortest, ticker)
+        return sorted(matches, key=rank)[:limit]
+
+    # Không có kết quả trùng khớp: xếp hạng theo số trigram chung (gõ sai chính tả)
+    query_grams = _ngrams(f" {folded} ")
+    overlap = Counter()
+    for gram in query_grams:
+        overlap.update(name_index["grams"].get(gram, ()))
+    threshold = max(1, len(query_grams) // 2)
+    ranked = sorted(overlap.items(), key=lambda item: (-item[1], item[0]))
+    ranked = [ticker for ticker, count in ranked if count >= threshold]
+    return ranked[:limit]